@@ -0,0 +1,26 @@
+from fastapi import APIRouter, Header, HTTPException
+from fastapi.responses import FileResponse
+from core.profiling import ProfileManager
+
+def build_profiles_router(manager: ProfileManager) -> APIRouter:
+    """Endpoints for listing and downloading request profiles. Every call must send ADMIN_TOKEN in X-Admin-Token."""
+    router = APIRouter()
+
+    def check_token(token: str | None):
+        if not manager.is_admin(token):
+            raise HTTPException(status_code=403, detail="A valid X-Admin-Token header is required.")
+
+    @router.get("/profiles", summary="List Captured Request Profiles")
+    def list_profiles(x_admin_token: str = Header(None)):
+        check_token(x_admin_token)
+        return manager.list_profiles()
+
+    @router.get("/profiles/{profile_id}", summary="Download a Request Profile in Folded-Stack Format")
+    def download_profile(profile_id: str, kind: str = "wall", x_admin_token: str = Header(None)):
+        check_token(x_admin_token)
+        path = manager.profile_path(profile_id, kind)
+        if path is None:
+            raise HTTPException(status_code=404, detail="Profile not found. kind must be 'wall' or 'cpu'.")
+        return FileResponse(path, media_type="text/plain", filename=path.name)
+
+    return router
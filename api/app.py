@@ -0,0 +1,99 @@
+"""The FastAPI application. Imported by main.py, which only adds the launcher."""
+import time
+import asyncio
+from fastapi import FastAPI, Request
+from fastapi.staticfiles import StaticFiles
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, PlainTextResponse
+from api.routes import router, kb_manager, history_store
+from core.metrics import metrics
+from core.profiling import profile_manager_from_env
+from api.admin import build_profiles_router
+from core.admission import AdmissionMiddleware, admission_controller_from_env
+
+app = FastAPI(title="Multi-Modal AI Assistant")
+
+# Per-endpoint concurrency limits and load shedding (ADMISSION_ENABLED=0 disables).
+# Added before CORS so shed responses still carry CORS headers.
+admission_controller = admission_controller_from_env()
+if admission_controller:
+    app.add_middleware(AdmissionMiddleware, controller=admission_controller)
+
+# Add CORS Middleware to allow the UI to connect
+origins = ["null", "http://localhost", "http://127.0.0.1:8000"]
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=origins,
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
+# Record latency per route template (not raw path) to keep label cardinality bounded
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    start = time.perf_counter()
+    metrics.add_gauge("http_requests_in_progress", 1)
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        metrics.add_gauge("http_requests_in_progress", -1)
+        route = request.scope.get("route")
+        path = getattr(route, "path", "unmatched")
+        metrics.observe("http_request_duration_seconds", time.perf_counter() - start,
+                        method=request.method, path=path, status=str(status))
+
+# Opt-in request profiling (PROFILING_ENABLED=1 plus ADMIN_TOKEN). When disabled, no middleware is installed at all.
+profile_manager = profile_manager_from_env()
+if profile_manager:
+    @app.middleware("http")
+    async def profile_request(request: Request, call_next):
+        if not profile_manager.wants_profile(request.headers, request.query_params):
+            return await call_next(request)
+        profiler = profile_manager.begin()
+        if profiler is None:
+            return await call_next(request)
+        status = 500
+        try:
+            response = await call_next(request)
+            status = response.status_code
+        finally:
+            # Stopping the sampler and writing the profile block, so they run off the event loop
+            profile_id = await asyncio.to_thread(profile_manager.finish, profiler, request.method, request.url.path, status)
+        response.headers["X-Profile-Id"] = profile_id
+        return response
+
+    app.include_router(build_profiles_router(profile_manager), prefix="/admin")
+
+# Mount static folders for downloads
+app.mount("/static", StaticFiles(directory="data"), name="static")
+
+# Include all your API endpoints
+app.include_router(router, prefix="/api")
+
+# Knowledge-base freshness sweeper and compaction (KB_LIFECYCLE_ENABLED=0 disables)
+@app.on_event("startup")
+def start_kb_lifecycle():
+    if kb_manager: kb_manager.start()
+
+@app.on_event("shutdown")
+def stop_kb_lifecycle():
+    if kb_manager: kb_manager.stop()
+
+# Drain answers still queued for the history database before the process exits
+@app.on_event("shutdown")
+def close_history_store():
+    history_store.close()
+
+# Prometheus scrape endpoint for stage histograms, cache hit rates and queue depths
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+def get_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+# Serve the index.html file at the root URL ("/")
+@app.get("/", response_class=FileResponse)
+def read_root():
+    return "index.html"
@@ -1,26 +1,40 @@
+import json
+import asyncio
 from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Query
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, StreamingResponse
 from pydantic import BaseModel
+from typing import List
 from pathlib import Path
 
 # Import all services and utilities
 from core.search_engine import SearchEngine
+from core.rag_system import get_image_rag_system
 from services.document_processor import DocumentProcessor
 from services.image_processor import ImageProcessor
 from services.video_processor import VideoProcessor
 from core.translator import CachingTranslator
 from core.tts_service import TextToSpeechService
 from core.utils import save_text_to_file
+from core.llm_gateway import get_llm_gateway
+from core.history_store import HistoryStore
+from core.kb_lifecycle import kb_lifecycle_from_env
+from core.metrics import start_request_timings
 
 router = APIRouter()
 
 # Initialize all service classes
 engine = SearchEngine()
-doc_processor = DocumentProcessor()
+# Documents are only extracted as far as the summarizer can use
+doc_processor = DocumentProcessor(max_chars=engine.summarizer.max_input_chars)
 image_processor = ImageProcessor()
 video_processor = VideoProcessor(engine.summarizer)
 translator = CachingTranslator()
 tts_service = TextToSpeechService()
+history_store = HistoryStore()
+doc_processor.keyword_extractor.attach_collection(engine.rag_system.collection)
+# Started and stopped with the app (see api/app.py); compaction swaps in a new collection, so the extractor follows it
+kb_manager = kb_lifecycle_from_env(engine.rag_system, engine.web_fetcher,
+                                   on_swap=doc_processor.keyword_extractor.attach_collection)
 
 UPLOADS_DIR = Path("data/uploads")
 UPLOADS_DIR.mkdir(exist_ok=True, parents=True)
@@ -42,16 +56,31 @@ class TTSRequest(BaseModel):
     text: str
     language_code: str = 'en'
 
+class BatchSearchRequest(BaseModel):
+    queries: List[str]
+    age_group: str = "adult"
+    concurrency: int = 8
+
+MAX_BATCH_QUERIES = 1000
+
+def _is_answer(summary: str) -> bool:
+    return bool(summary) and "Sorry" not in summary and "API Error" not in summary
+
 # --- API ENDPOINTS ---
 
 @router.get("/search-and-process", summary="All-in-One Search Endpoint")
 async def search_and_process(
     query: str, age_group: str = "adult",
-    translate_to: str = Query(None), speak: bool = Query(False), download: bool = Query(False)
+    translate_to: str = Query(None), speak: bool = Query(False), download: bool = Query(False),
+    debug: bool = Query(False)
 ):
+    # In debug mode every timed stage of this request is returned with the result
+    timings = start_request_timings() if debug else None
     result = await engine.search(query, age_group)
     summary = result.get("summary", "")
-    if "Sorry" not in summary and "API Error" not in summary:
+    if _is_answer(summary):
+        history_store.record("search", query, summary, age_group=age_group, source=result.get("source"),
+                             title=result.get("title"), metadata={"type": result.get("type")})
         if translate_to: result["translated_summary"] = translator.translate(summary, translate_to)
         if speak:
             audio_filepath = tts_service.speak(summary, lang='en', query=query)
@@ -62,18 +91,44 @@ async def search_and_process(
             summary_path = save_text_to_file(summary, query)
             path_str = summary_path.as_posix()
             result["summary_download_url"] = path_str.replace("data", "/static", 1)
+    if timings is not None:
+        result["timings"] = timings
     return result
 
+@router.post("/batch-search", summary="Search Many Queries, Streaming Results as NDJSON")
+async def batch_search(request: BatchSearchRequest):
+    if not request.queries:
+        raise HTTPException(status_code=400, detail="Please provide at least one query.")
+    if len(request.queries) > MAX_BATCH_QUERIES:
+        raise HTTPException(status_code=400, detail=f"A batch may contain at most {MAX_BATCH_QUERIES} queries.")
+    concurrency = max(1, min(request.concurrency, 32))
+
+    async def stream_results():
+        # One JSON object per line, written as each query finishes
+        async for result in engine.search_many(request.queries, request.age_group, concurrency=concurrency):
+            if _is_answer(result.get("summary", "")):
+                history_store.record("search", result["query"], result["summary"], age_group=request.age_group,
+                                     source=result.get("source"), title=result.get("title"), metadata={"type": result.get("type"), "batch": True})
+            yield json.dumps(result) + "\n"
+
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+
 @router.post("/summarize-document/", summary="Summarize a Document")
 async def summarize_document(
     age_group: str = Form("adult"), file: UploadFile = File(...), download: bool = Form(False)
 ):
     filepath = UPLOADS_DIR / file.filename
     with open(filepath, "wb") as buffer: buffer.write(await file.read())
-    text = doc_processor.extract_text_from_file(filepath)
-    keywords = doc_processor.extract_keywords(text)
-    summary = engine.summarizer.generate_summary(text, f"the document {file.filename}", age_group)
+    # Extraction fans out to worker processes; keep the event loop free while it runs
+    text = await asyncio.to_thread(doc_processor.extract_text_from_file, filepath)
+    # Keyword extraction is local and runs alongside the LLM summary
+    keywords, summary = await asyncio.gather(
+        asyncio.to_thread(doc_processor.extract_keywords, text),
+        asyncio.to_thread(engine.summarizer.generate_summary, text, f"the document {file.filename}", age_group),
+    )
     result = {"filename": file.filename, "keywords": keywords, "summary": summary}
+    if _is_answer(summary):
+        history_store.record("document", file.filename, summary, age_group=age_group, metadata={"keywords": keywords})
     if download:
         summary_path = save_text_to_file(result["summary"], file.filename)
         path_str = summary_path.as_posix()
@@ -88,6 +143,8 @@ async def summarize_image(
     with open(filepath, "wb") as buffer: buffer.write(await file.read())
     summary = await image_processor.get_summary_for_image(filepath, age_group)
     result = {"filename": file.filename, "summary": summary}
+    if _is_answer(summary):
+        history_store.record("image", file.filename, summary, age_group=age_group)
     if download:
         summary_path = save_text_to_file(result["summary"], file.filename)
         path_str = summary_path.as_posix()
@@ -113,8 +170,74 @@ async def summarize_video(
         input_source = video_url
         
     result_dict = await video_processor.summarize_video(input_source, age_group)
+    if _is_answer(result_dict.get("summary", "")):
+        history_store.record("video", input_source, result_dict["summary"], age_group=age_group, source=video_url)
     return {"input_source": input_source, **result_dict}
 
+def _with_image_urls(results: list) -> list:
+    """Adds a /static download URL to image results that live under the data folder."""
+    for item in results:
+        path_str = Path(item.get("filepath", "")).as_posix()
+        if path_str.startswith("data/"):
+            item["image_url"] = path_str.replace("data", "/static", 1)
+    return results
+
+@router.get("/search-images", summary="Search Indexed Images by Text")
+async def search_images(
+    query: str, k: int = Query(5, ge=1, le=50),
+    min_score: float = Query(0.0, ge=-1.0, le=1.0), offset: int = Query(0, ge=0)
+):
+    # The first image search loads CLIP, so the getter also runs off the event loop
+    image_rag = await asyncio.to_thread(get_image_rag_system)
+    results = await asyncio.to_thread(image_rag.search_images_by_text, query, k=k, min_score=min_score, offset=offset)
+    return {"query": query, "k": k, "offset": offset, "results": _with_image_urls(results)}
+
+@router.post("/search-images-by-image/", summary="Find Indexed Images Similar to an Uploaded Image")
+async def search_images_by_image(
+    file: UploadFile = File(...), k: int = Form(5),
+    min_score: float = Form(0.0), offset: int = Form(0)
+):
+    if not 1 <= k <= 50 or offset < 0:
+        raise HTTPException(status_code=400, detail="k must be between 1 and 50 and offset must not be negative.")
+    image_bytes = await file.read()
+    image_rag = await asyncio.to_thread(get_image_rag_system)
+    try:
+        results = await asyncio.to_thread(image_rag.search_images_by_image, image_bytes, k=k, min_score=min_score, offset=offset)
+    except OSError:
+        raise HTTPException(status_code=400, detail="The uploaded file is not a readable image.")
+    return {"filename": file.filename, "k": k, "offset": offset, "results": _with_image_urls(results)}
+
+@router.get("/history", summary="List Past Answers, Newest First")
+def list_history(
+    limit: int = Query(20, ge=1, le=100), cursor: str = Query(None),
+    age_group: str = Query(None), kind: str = Query(None), query: str = Query(None)
+):
+    # Pass the returned next_cursor to fetch the following page
+    try:
+        return history_store.list(limit=limit, cursor=cursor, age_group=age_group, kind=kind, query=query)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
+
+@router.get("/history/search", summary="Full-Text Search Over Past Answers")
+def search_history(
+    q: str, limit: int = Query(20, ge=1, le=100), cursor: str = Query(None), age_group: str = Query(None)
+):
+    try:
+        return history_store.search(q, limit=limit, cursor=cursor, age_group=age_group)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
+
+@router.get("/history/{answer_id}", summary="Get One Past Answer")
+def get_history_item(answer_id: int):
+    item = history_store.get(answer_id)
+    if item is None:
+        raise HTTPException(status_code=404, detail="Answer not found.")
+    return item
+
 @router.get("/languages", summary="Get Available Translation Languages")
 def get_available_languages():
-    return SUPPORTED_LANGUAGES
\ No newline at end of file
+    return SUPPORTED_LANGUAGES
+
+@router.get("/llm-metrics", summary="Per-Model LLM Latency, Error and Rate-Limit Metrics")
+def get_llm_metrics():
+    return get_llm_gateway().metrics()
\ No newline at end of file
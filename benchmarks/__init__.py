@@ -0,0 +1 @@
+# Offline load-test and latency benchmark harness
@@ -0,0 +1,68 @@
+"""
+Compares embedding backends for encode throughput, memory and agreement with PyTorch.
+
+    python -m benchmarks.embedding_backends
+    python -m benchmarks.embedding_backends --backends torch,onnx-int8 --threads 4
+
+Run from the project root so ONNX exports land in data/onnx_models and are reused by the app.
+"""
+import gc
+import time
+import argparse
+from benchmarks.load_test import current_rss_mb
+from core.embedding_backends import EMBEDDING_BACKENDS, VALIDATION_SENTENCES, cosine_agreement, load_with_backend
+from core.rag_system import TEXT_EMBEDDING_MODEL
+
+def corpus(size: int) -> list:
+    """Sentence-length texts with varied vocabulary, similar to search contexts."""
+    base = VALIDATION_SENTENCES
+    return [f"{base[i % len(base)]} Variant {i} mentions topic {i * 7 % 113} and detail {i * 13 % 97}." for i in range(size)]
+
+def throughput(model, texts: list, batch_size: int, repeats: int) -> float:
+    model.encode(texts[:batch_size], batch_size=batch_size)  # warm-up
+    start = time.perf_counter()
+    for _ in range(repeats):
+        model.encode(texts, batch_size=batch_size)
+    return len(texts) * repeats / (time.perf_counter() - start)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark embedding backends.")
+    parser.add_argument("--model", default=TEXT_EMBEDDING_MODEL)
+    parser.add_argument("--backends", default=",".join(EMBEDDING_BACKENDS))
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--quantization", default="avx2", choices=["arm64", "avx2", "avx512", "avx512_vnni"])
+    parser.add_argument("--sentences", type=int, default=512)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    texts = corpus(args.sentences)
+    reference = load_with_backend(args.model, "torch", threads=args.threads)
+    rows = []
+    for backend in args.backends.split(","):
+        gc.collect()
+        rss_before = current_rss_mb()
+        start = time.perf_counter()
+        model = reference if backend == "torch" else load_with_backend(
+            args.model, backend, threads=args.threads, quantization=args.quantization)
+        load_s = time.perf_counter() - start
+        rows.append({
+            "backend": backend,
+            "load_s": round(load_s, 2),
+            "rss_delta_mb": round(current_rss_mb() - rss_before, 1),
+            "single_per_s": round(throughput(model, texts[:64], 1, args.repeats), 1),
+            "batch32_per_s": round(throughput(model, texts, 32, args.repeats), 1),
+            "min_cosine": round(cosine_agreement(model, reference, texts[:64]), 5),
+        })
+        if model is not reference:
+            del model
+
+    print(f"\nModel: {args.model}  threads: {args.threads or 'default'}  sentences: {args.sentences}\n")
+    header = f"{'backend':<12}{'load s':>8}{'RSS +MB':>10}{'single/s':>11}{'batch32/s':>11}{'min cos':>10}"
+    print(header)
+    print("-" * len(header))
+    for r in rows:
+        print(f"{r['backend']:<12}{r['load_s']:>8}{r['rss_delta_mb']:>10}{r['single_per_s']:>11}{r['batch32_per_s']:>11}{r['min_cosine']:>10}")
+    print("\nRSS for 'torch' is measured before any other backend loads; later rows include only their own model.")
+
+if __name__ == "__main__":
+    main()
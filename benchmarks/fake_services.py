@@ -0,0 +1,155 @@
+"""
+Local stand-ins for the external services the app depends on, so load tests never touch
+Groq, Google CSE, DuckDuckGo or YouTube.
+
+- StubLLMServer: an OpenAI/Groq-compatible chat and transcription API with configurable latency.
+- CorpusServer: serves generated HTML pages that look like real articles (boilerplate included).
+- install_fakes(): points the app's search providers and YouTube lookups at the local corpus.
+"""
+import time
+import random
+import asyncio
+import hashlib
+import threading
+from aiohttp import web
+
+class StubLLMServer:
+    """Answers /openai/v1/chat/completions after `base_latency + per_1k_tokens * prompt_size` seconds."""
+    def __init__(self, base_latency: float = 0.3, per_1k_tokens: float = 0.05, jitter: float = 0.1,
+                 error_rate: float = 0.0, reply_words: int = 120):
+        self.base_latency = base_latency
+        self.per_1k_tokens = per_1k_tokens
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.reply_words = reply_words
+        self.requests = 0
+
+    def build_app(self) -> web.Application:
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_post("/openai/v1/chat/completions", self.chat_completions)
+        app.router.add_post("/openai/v1/audio/transcriptions", self.transcriptions)
+        return app
+
+    async def _delay(self, prompt_tokens: int):
+        latency = self.base_latency + self.per_1k_tokens * prompt_tokens / 1000
+        await asyncio.sleep(max(0.0, latency + random.uniform(-self.jitter, self.jitter)))
+
+    async def chat_completions(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        body = await request.json()
+        prompt_chars = 0
+        for message in body.get("messages", []):
+            content = message.get("content", "")
+            prompt_chars += len(content) if isinstance(content, str) else sum(len(p.get("text", "")) for p in content)
+        prompt_tokens = prompt_chars // 4 + 1
+        await self._delay(prompt_tokens)
+        if random.random() < self.error_rate:
+            return web.json_response({"error": {"message": "Rate limit reached", "type": "rate_limit_exceeded"}},
+                                     status=429, headers={"retry-after": "0.2"})
+
+        text = " ".join(f"word{i}" for i in range(self.reply_words)) + "."
+        return web.json_response({
+            "id": f"chatcmpl-bench-{self.requests}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "stub"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": self.reply_words,
+                      "total_tokens": prompt_tokens + self.reply_words},
+        })
+
+    async def transcriptions(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        await request.read()
+        await self._delay(0)
+        return web.json_response({"text": "This is a stub transcription of the uploaded audio."})
+
+class CorpusServer:
+    """Serves a deterministic article page for every path under /page/."""
+    def __init__(self, latency: float = 0.05, paragraphs: int = 40):
+        self.latency = latency
+        self.paragraphs = paragraphs
+
+    def build_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/page/{slug}", self.page)
+        return app
+
+    async def page(self, request: web.Request) -> web.Response:
+        await asyncio.sleep(self.latency)
+        slug = request.match_info["slug"]
+        rng = random.Random(slug)
+        nav = "".join(f"<li><a href='/page/{rng.randint(0, 10**6)}'>Related link {i}</a></li>" for i in range(30))
+        body = "".join(
+            f"<p>Section {i} about {slug}. " + " ".join(f"term{rng.randint(0, 5000)}" for _ in range(60)) + ".</p>"
+            for i in range(self.paragraphs)
+        )
+        html = (f"<html><head><title>{slug}</title><script>var x = 1;</script><style>p {{}}</style></head>"
+                f"<body><nav><ul>{nav}</ul></nav><header>Site header</header><article><h1>{slug}</h1>{body}</article>"
+                f"<footer>Copyright</footer></body></html>")
+        return web.Response(text=html, content_type="text/html")
+
+class FakeServices:
+    """Runs the stub LLM and corpus servers on a background event loop."""
+    def __init__(self, llm: StubLLMServer, corpus: CorpusServer, host: str = "127.0.0.1"):
+        self.llm, self.corpus, self.host = llm, corpus, host
+        self.llm_port = self.corpus_port = None
+        self._loop = asyncio.new_event_loop()
+        self._runners = []
+        self._thread = threading.Thread(target=self._loop.run_forever, name="fake-services", daemon=True)
+
+    async def _serve(self, app: web.Application) -> int:
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, self.host, 0)
+        await site.start()
+        self._runners.append(runner)
+        return site._server.sockets[0].getsockname()[1]
+
+    def start(self) -> "FakeServices":
+        self._thread.start()
+        self.llm_port = asyncio.run_coroutine_threadsafe(self._serve(self.llm.build_app()), self._loop).result()
+        self.corpus_port = asyncio.run_coroutine_threadsafe(self._serve(self.corpus.build_app()), self._loop).result()
+        return self
+
+    def stop(self):
+        async def _cleanup():
+            for runner in self._runners:
+                await runner.cleanup()
+        asyncio.run_coroutine_threadsafe(_cleanup(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+    @property
+    def llm_base_url(self) -> str:
+        return f"http://{self.host}:{self.llm_port}"
+
+    @property
+    def corpus_base_url(self) -> str:
+        return f"http://{self.host}:{self.corpus_port}"
+
+def install_fakes(corpus_base_url: str, search_latency: float = 0.2, results: int = 3):
+    """
+    Patches the app's outbound lookups. Must run before `main` is imported so that
+    the route module's service instances are built from the patched classes.
+    """
+    from core.web_fetcher import WebFetcher
+    from services.audio_processor import AudioProcessor
+    from services import youtube_processor
+
+    async def fake_search(self, query: str, max_results: int = results):
+        await asyncio.sleep(search_latency)
+        slug = hashlib.sha1(query.encode("utf-8")).hexdigest()[:12]
+        return [{"href": f"{corpus_base_url}/page/{slug}-{i}", "title": f"{query} ({i})"} for i in range(max_results)]
+
+    def fake_video_search(self, query: str):
+        time.sleep(search_latency)
+        return None
+
+    def fake_video_processor_init(self, summarizer):
+        # Skips the Whisper model download and the ffmpeg binary check; video endpoints are not benchmarked
+        self.summarizer = summarizer
+
+    WebFetcher.search_google_api = fake_search
+    WebFetcher.search_ddg = fake_search
+    AudioProcessor.search_for_video = fake_video_search
+    youtube_processor.VideoProcessor.__init__ = fake_video_processor_init
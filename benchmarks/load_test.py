@@ -0,0 +1,255 @@
+"""
+Boots the app against local fake services, drives concurrent load at each endpoint and
+reports p50/p95/p99 latency, requests per second and process RSS.
+
+The app, the fake services and the load driver share one process (and one GIL), so RSS is
+reported for the whole process: its value after each endpoint's run and how much it grew
+during that run. Endpoints run one after another, so the growth is the best per-endpoint
+signal, but memory kept by earlier runs still counts towards later totals.
+
+    python -m benchmarks.load_test --concurrency 16 --requests 200
+    python -m benchmarks.load_test --save-baseline main
+    python -m benchmarks.load_test --compare main --tolerance 0.15
+
+The app runs in a scratch working directory, so its Chroma stores, uploads and caches
+never touch the real `data/` folder. Embedding models are loaded from the local
+Hugging Face cache like in production.
+"""
+import os
+import io
+import sys
+import json
+import time
+import shutil
+import asyncio
+import argparse
+import tempfile
+import threading
+import resource
+from pathlib import Path
+from typing import Callable, Dict, List
+
+import aiohttp
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+BASELINE_DIR = PROJECT_ROOT / "benchmarks" / "baselines"
+RESULTS_DIR = PROJECT_ROOT / "benchmarks" / "results"
+
+def current_rss_mb() -> float:
+    """Resident set size of the whole process (app, fakes and driver share it), not of one endpoint."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # Without /proc, fall back to the peak RSS so far; ru_maxrss is in KB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def percentile(ordered: List[float], p: float) -> float:
+    if not ordered: return 0.0
+    return ordered[min(len(ordered) - 1, max(0, int(round(p / 100 * len(ordered))) - 1))]
+
+def sample_png() -> bytes:
+    from PIL import Image
+    buffer = io.BytesIO()
+    Image.new("RGB", (64, 64), (120, 160, 200)).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+def sample_document(i: int) -> bytes:
+    paragraphs = [f"Paragraph {p} of benchmark document {i}. " + " ".join(f"token{(i * 31 + p * 7 + w) % 997}" for w in range(80))
+                  for p in range(60)]
+    return "\n\n".join(paragraphs).encode("utf-8")
+
+def build_scenarios(base_url: str) -> Dict[str, Callable]:
+    """Each scenario issues one request for iteration `i` and returns the HTTP status."""
+    png = sample_png()
+
+    async def search(session: aiohttp.ClientSession, i: int) -> int:
+        params = {"query": f"benchmark topic {i}", "age_group": "adult"}
+        async with session.get(f"{base_url}/api/search-and-process", params=params) as response:
+            await response.read()
+            return response.status
+
+    async def search_repeat(session: aiohttp.ClientSession, i: int) -> int:
+        # A small working set, so most requests are knowledge-base hits
+        params = {"query": f"benchmark topic {i % 10}", "age_group": "adult"}
+        async with session.get(f"{base_url}/api/search-and-process", params=params) as response:
+            await response.read()
+            return response.status
+
+    async def document(session: aiohttp.ClientSession, i: int) -> int:
+        form = aiohttp.FormData()
+        form.add_field("age_group", "adult")
+        form.add_field("file", sample_document(i), filename=f"bench_{i}.txt", content_type="text/plain")
+        async with session.post(f"{base_url}/api/summarize-document/", data=form) as response:
+            await response.read()
+            return response.status
+
+    async def image(session: aiohttp.ClientSession, i: int) -> int:
+        form = aiohttp.FormData()
+        form.add_field("age_group", "adult")
+        form.add_field("file", png, filename=f"bench_{i}.png", content_type="image/png")
+        async with session.post(f"{base_url}/api/summarize-image/", data=form) as response:
+            await response.read()
+            return response.status
+
+    async def batch(session: aiohttp.ClientSession, i: int) -> int:
+        # One request answers 20 cold queries; compare rps * 20 against the 'search' scenario
+        payload = {"queries": [f"benchmark batch {i} topic {q}" for q in range(20)], "age_group": "adult"}
+        async with session.post(f"{base_url}/api/batch-search", json=payload) as response:
+            async for _ in response.content:
+                pass
+            return response.status
+
+    return {"search": search, "search-repeat": search_repeat, "batch": batch, "document": document, "image": image}
+
+async def drive(scenario: Callable, requests: int, concurrency: int, warmup: int, offset: int) -> dict:
+    """Runs `requests` calls with at most `concurrency` in flight and summarizes the latencies."""
+    latencies, statuses = [], {}
+    rss_before = current_rss_mb()
+    timeout = aiohttp.ClientTimeout(total=300)
+    async with aiohttp.ClientSession(timeout=timeout) as session:
+        for i in range(warmup):
+            await scenario(session, offset - warmup + i)
+
+        queue = iter(range(offset, offset + requests))
+        async def worker():
+            for i in queue:
+                start = time.perf_counter()
+                try:
+                    status = await scenario(session, i)
+                except Exception as e:
+                    status = type(e).__name__
+                latencies.append(time.perf_counter() - start)
+                statuses[str(status)] = statuses.get(str(status), 0) + 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        wall = time.perf_counter() - start
+
+    ordered = sorted(latencies)
+    rss_after = current_rss_mb()
+    return {
+        "requests": requests, "concurrency": concurrency,
+        "p50_ms": round(percentile(ordered, 50) * 1000, 1),
+        "p95_ms": round(percentile(ordered, 95) * 1000, 1),
+        "p99_ms": round(percentile(ordered, 99) * 1000, 1),
+        "max_ms": round(ordered[-1] * 1000, 1) if ordered else 0.0,
+        "rps": round(requests / wall, 2) if wall else 0.0,
+        "proc_rss_mb": round(rss_after, 1),
+        "proc_rss_delta_mb": round(rss_after - rss_before, 1),
+        "statuses": statuses,
+    }
+
+def boot_app(workdir: Path, port: int):
+    """Imports the app from a scratch working directory and serves it on a background thread."""
+    import uvicorn
+    os.chdir(workdir)
+    (workdir / "data").mkdir(exist_ok=True)
+    shutil.copy(PROJECT_ROOT / "index.html", workdir / "index.html")
+    sys.path.insert(0, str(PROJECT_ROOT))
+    import main
+
+    server = uvicorn.Server(uvicorn.Config(main.app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, name="uvicorn", daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, thread
+
+def compare(results: dict, baseline: dict, tolerance: float) -> List[str]:
+    """Flags endpoints whose p95 grew or throughput dropped by more than `tolerance`."""
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if not previous: continue
+        if current["p95_ms"] > previous["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {previous['p95_ms']}ms -> {current['p95_ms']}ms")
+        if current["rps"] < previous["rps"] * (1 - tolerance):
+            regressions.append(f"{name}: rps {previous['rps']} -> {current['rps']}")
+    return regressions
+
+def print_table(results: dict):
+    header = f"{'endpoint':<16}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'rps':>9}{'proc RSS MB':>13}{'RSS +MB':>9}  statuses"
+    print(header)
+    print("-" * len(header))
+    for name, r in results.items():
+        print(f"{name:<16}{r['p50_ms']:>10}{r['p95_ms']:>10}{r['p99_ms']:>10}{r['rps']:>9}{r['proc_rss_mb']:>13}{r['proc_rss_delta_mb']:>9}  {r['statuses']}")
+
+def main_cli():
+    from benchmarks.fake_services import StubLLMServer, CorpusServer, FakeServices, install_fakes
+
+    parser = argparse.ArgumentParser(description="Offline load test for the Multi-Modal AI Assistant API.")
+    parser.add_argument("--endpoints", default="search,search-repeat,document,image",
+                        help="Comma-separated scenarios: search, search-repeat, batch, document, image.")
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--llm-latency", type=float, default=0.3, help="Base stub LLM latency in seconds.")
+    parser.add_argument("--llm-per-1k-tokens", type=float, default=0.05)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0, help="Fraction of LLM calls answered with 429.")
+    parser.add_argument("--page-latency", type=float, default=0.05)
+    parser.add_argument("--search-latency", type=float, default=0.2)
+    parser.add_argument("--save-baseline", metavar="NAME", help="Store the results as a named baseline.")
+    parser.add_argument("--compare", metavar="NAME", help="Compare against a named baseline; exits 1 on regression.")
+    parser.add_argument("--tolerance", type=float, default=0.15)
+    args = parser.parse_args()
+
+    fakes = FakeServices(
+        StubLLMServer(args.llm_latency, args.llm_per_1k_tokens, error_rate=args.llm_error_rate),
+        CorpusServer(args.page_latency),
+    ).start()
+    os.environ.update({"GROQ_API_KEY": "benchmark", "GROQ_BASE_URL": fakes.llm_base_url,
+                       "GROQ_RPM": "100000", "GROQ_TPM": "100000000", "GROQ_LIMITS": ""})
+    sys.path.insert(0, str(PROJECT_ROOT))
+    install_fakes(fakes.corpus_base_url, search_latency=args.search_latency)
+
+    workdir = Path(tempfile.mkdtemp(prefix="bench_"))
+    server, thread = boot_app(workdir, args.port)
+    print(f"App booted in {workdir} (RSS {current_rss_mb():.0f} MB). Stub LLM at {fakes.llm_base_url}.")
+
+    scenarios = build_scenarios(f"http://127.0.0.1:{args.port}")
+    results = {}
+    try:
+        for offset, name in enumerate(args.endpoints.split(",")):
+            name = name.strip()
+            if name not in scenarios:
+                parser.error(f"Unknown scenario '{name}'. Choose from: {', '.join(scenarios)}")
+            print(f"Running '{name}': {args.requests} requests at concurrency {args.concurrency}...")
+            results[name] = asyncio.run(drive(scenarios[name], args.requests, args.concurrency,
+                                              args.warmup, offset=(offset + 1) * 100_000))
+    finally:
+        server.should_exit = True
+        thread.join(timeout=10)
+        fakes.stop()
+        os.chdir(PROJECT_ROOT)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print()
+    print_table(results)
+    report = {"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "args": vars(args), "results": results}
+    RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+    (RESULTS_DIR / f"run_{time.strftime('%Y%m%d_%H%M%S')}.json").write_text(json.dumps(report, indent=2))
+
+    if args.save_baseline:
+        BASELINE_DIR.mkdir(parents=True, exist_ok=True)
+        (BASELINE_DIR / f"{args.save_baseline}.json").write_text(json.dumps(report, indent=2))
+        print(f"\nBaseline '{args.save_baseline}' saved.")
+
+    if args.compare:
+        baseline_path = BASELINE_DIR / f"{args.compare}.json"
+        if not baseline_path.exists():
+            sys.exit(f"Baseline '{args.compare}' not found at {baseline_path}")
+        regressions = compare(results, json.loads(baseline_path.read_text())["results"], args.tolerance)
+        if regressions:
+            print("\nREGRESSIONS:")
+            for line in regressions: print(f"  {line}")
+            sys.exit(1)
+        print(f"\nNo regressions against '{args.compare}' (tolerance {args.tolerance:.0%}).")
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,209 @@
+import os
+import math
+import time
+import asyncio
+import logging
+import itertools
+from typing import Dict, List, Optional
+from fastapi.responses import JSONResponse
+from core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Lower numbers are served first when requests wait for a shared slot
+PRIORITIES = {"interactive": 0, "batch": 1, "heavy": 2}
+
+# endpoint name: (priority class, max concurrent, max queued, max queue wait in seconds)
+DEFAULT_POLICIES = {
+    "search-and-process": ("interactive", 32, 64, 2.0),
+    "search-images": ("interactive", 16, 32, 2.0),
+    "search-images-by-image": ("interactive", 8, 16, 2.0),
+    "batch-search": ("batch", 2, 2, 5.0),
+    "summarize-document": ("heavy", 4, 8, 30.0),
+    "summarize-image": ("heavy", 4, 8, 30.0),
+    "summarize-video": ("heavy", 2, 2, 30.0),
+}
+
+class AdmissionRejected(Exception):
+    """Raised when a request cannot be admitted; carries the HTTP status and a Retry-After hint."""
+    def __init__(self, status_code: int, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.status_code = status_code
+        self.reason = reason
+        self.retry_after = retry_after
+
+class PriorityLimiter:
+    """
+    Admits up to `limit` concurrent holders. Waiters are served by priority, then arrival
+    order, and at most `max_queue` may wait. Each waiter brings a `cap` so lower priorities
+    can be kept below `limit`, leaving the remaining slots for higher priorities.
+    Must be used from a single event loop.
+    """
+    def __init__(self, limit: int, max_queue: int):
+        self.limit = limit
+        self.max_queue = max_queue
+        self.active = 0
+        self._waiters: List[list] = []  # sorted [priority, seq, cap, future]
+        self._seq = itertools.count()
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    def _wake(self):
+        for entry in list(self._waiters):
+            future = entry[3]
+            if future.done():
+                self._waiters.remove(entry)
+            elif self.active < entry[2]:
+                self._waiters.remove(entry)
+                self.active += 1
+                future.set_result(None)
+
+    async def acquire(self, priority: int = 0, cap: Optional[int] = None, timeout: Optional[float] = None):
+        """Waits for a slot. Raises asyncio.TimeoutError after `timeout` and OverflowError if the queue is full."""
+        entry = [priority, next(self._seq), min(cap or self.limit, self.limit), asyncio.get_running_loop().create_future()]
+        self._waiters.append(entry)
+        self._waiters.sort(key=lambda e: (e[0], e[1]))
+        self._wake()
+        future = entry[3]
+        if future.done():
+            return
+        if len(self._waiters) > self.max_queue:
+            self._waiters.remove(entry)
+            raise OverflowError("queue is full")
+        try:
+            await asyncio.wait_for(future, timeout)
+        except BaseException:
+            if future.done() and not future.cancelled():
+                # The slot was handed over just as the wait ended
+                self.release()
+            elif entry in self._waiters:
+                self._waiters.remove(entry)
+            raise
+
+    def release(self):
+        self.active -= 1
+        self._wake()
+
+class EndpointPolicy:
+    def __init__(self, name: str, priority_class: str, limit: int, max_queue: int, queue_timeout: float):
+        if priority_class not in PRIORITIES:
+            raise ValueError(f"Unknown priority class '{priority_class}'. Use one of {list(PRIORITIES)}.")
+        self.name = name
+        self.priority_class = priority_class
+        self.priority = PRIORITIES[priority_class]
+        self.queue_timeout = queue_timeout
+        self.limiter = PriorityLimiter(limit, max_queue)
+        # Smoothed time a request holds its slot, used for Retry-After
+        self.service_time = 1.0
+
+class AdmissionController:
+    """
+    Per-endpoint concurrency limits with bounded wait queues, plus a process-wide pool shared
+    by all limited endpoints. `interactive_reserved` slots of the shared pool can only be taken
+    by interactive endpoints, so heavy uploads cannot crowd out searches.
+
+    Requests that find their endpoint's queue full get 429; requests that wait too long, or
+    find the shared queue full, get 503. Both carry Retry-After.
+    """
+    def __init__(self, policies: Optional[Dict[str, tuple]] = None, global_limit: int = 32,
+                 interactive_reserved: int = 8, global_queue: int = 128, path_prefix: str = "/api"):
+        self.policies: Dict[str, EndpointPolicy] = {}
+        for name, (priority_class, limit, max_queue, queue_timeout) in (policies or DEFAULT_POLICIES).items():
+            self.policies[f"{path_prefix}/{name}"] = EndpointPolicy(name, priority_class, limit, max_queue, queue_timeout)
+        self.global_limiter = PriorityLimiter(global_limit, global_queue)
+        self.interactive_reserved = min(interactive_reserved, global_limit - 1)
+        metrics.gauge_callback("admission_in_flight", lambda: self._state("active"))
+        metrics.gauge_callback("admission_queued", lambda: self._state("queued"))
+        metrics.gauge_callback("admission_limit", lambda: self._state("limit"))
+
+    def _state(self, field: str) -> Dict[tuple, float]:
+        state = {(("endpoint", p.name),): getattr(p.limiter, field) for p in self.policies.values()}
+        state[(("endpoint", "_global"),)] = getattr(self.global_limiter, field)
+        return state
+
+    def policy_for(self, path: str) -> Optional[EndpointPolicy]:
+        return self.policies.get(path.rstrip("/"))
+
+    def _retry_after(self, policy: EndpointPolicy) -> int:
+        limiter = policy.limiter
+        return max(1, min(120, math.ceil(policy.service_time * (limiter.queued + 1) / limiter.limit)))
+
+    def _reject(self, policy: EndpointPolicy, status_code: int, reason: str):
+        metrics.inc("admission_rejected_total", endpoint=policy.name, reason=reason)
+        logger.warning(f"Shedding request to '{policy.name}' ({reason}).")
+        raise AdmissionRejected(status_code, reason, self._retry_after(policy))
+
+    async def acquire(self, policy: EndpointPolicy):
+        """Takes an endpoint slot and then a shared slot, within the endpoint's queue timeout."""
+        start = time.monotonic()
+        try:
+            await policy.limiter.acquire(timeout=policy.queue_timeout)
+        except OverflowError:
+            self._reject(policy, 429, "endpoint_queue_full")
+        except asyncio.TimeoutError:
+            self._reject(policy, 503, "endpoint_queue_timeout")
+
+        cap = None if policy.priority_class == "interactive" else self.global_limiter.limit - self.interactive_reserved
+        remaining = max(0.0, policy.queue_timeout - (time.monotonic() - start))
+        try:
+            await self.global_limiter.acquire(policy.priority, cap, remaining)
+        except BaseException as e:
+            policy.limiter.release()
+            if isinstance(e, OverflowError):
+                self._reject(policy, 503, "global_queue_full")
+            if isinstance(e, asyncio.TimeoutError):
+                self._reject(policy, 503, "global_queue_timeout")
+            raise
+        metrics.observe("admission_wait_seconds", time.monotonic() - start, endpoint=policy.name)
+
+    def release(self, policy: EndpointPolicy, held_for: float):
+        self.global_limiter.release()
+        policy.limiter.release()
+        policy.service_time = 0.8 * policy.service_time + 0.2 * held_for
+
+class AdmissionMiddleware:
+    """ASGI middleware that holds an admission slot for the whole request, including streamed bodies."""
+    def __init__(self, app, controller: AdmissionController):
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope, receive, send):
+        policy = self.controller.policy_for(scope["path"]) if scope["type"] == "http" else None
+        if policy is None:
+            return await self.app(scope, receive, send)
+        try:
+            await self.controller.acquire(policy)
+        except AdmissionRejected as e:
+            response = JSONResponse(
+                {"detail": f"The server is busy ({e.reason}). Please retry later."},
+                status_code=e.status_code, headers={"Retry-After": str(e.retry_after)},
+            )
+            return await response(scope, receive, send)
+        start = time.monotonic()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release(policy, time.monotonic() - start)
+
+def _env_policies(name: str) -> Dict[str, tuple]:
+    """Applies 'endpoint=limit:queue:timeout' overrides, e.g. 'summarize-video=1:0:10;search-and-process=64:128:2'."""
+    policies = dict(DEFAULT_POLICIES)
+    for item in os.getenv(name, "").split(";"):
+        if "=" not in item: continue
+        endpoint, values = (part.strip() for part in item.split("=", 1))
+        limit, max_queue, queue_timeout = values.split(":")
+        priority_class = policies.get(endpoint, ("heavy",))[0]
+        policies[endpoint] = (priority_class, int(limit), int(max_queue), float(queue_timeout))
+    return policies
+
+def admission_controller_from_env() -> Optional[AdmissionController]:
+    """Builds the controller from ADMISSION_LIMITS, ADMISSION_GLOBAL_LIMIT and ADMISSION_INTERACTIVE_RESERVED; ADMISSION_ENABLED=0 turns it off."""
+    if os.getenv("ADMISSION_ENABLED", "1") == "0":
+        return None
+    return AdmissionController(
+        policies=_env_policies("ADMISSION_LIMITS"),
+        global_limit=int(os.getenv("ADMISSION_GLOBAL_LIMIT", "32")),
+        interactive_reserved=int(os.getenv("ADMISSION_INTERACTIVE_RESERVED", "8")),
+    )
@@ -0,0 +1,48 @@
+import re
+import logging
+import numpy as np
+from typing import List
+from core.utils import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+class ContextSelector:
+    """Trims a context down to the sentences most relevant to the query before it is summarized."""
+    def __init__(self, embedding_model, token_budget: int = 600, min_sentence_chars: int = 20):
+        # Reuses the RAG system's MiniLM model, so no extra model is loaded
+        self.embedding_model = embedding_model
+        self.token_budget = token_budget
+        self.min_sentence_chars = min_sentence_chars
+
+    def split_sentences(self, text: str) -> List[str]:
+        """Splits on sentence punctuation and line breaks, dropping fragments too short to carry content."""
+        sentences = re.split(r'(?<=[.!?])\s+|\n+', text)
+        return [s.strip() for s in sentences if len(s.strip()) >= self.min_sentence_chars]
+
+    def select(self, context: str, query: str, token_budget: int = None) -> str:
+        """Returns the highest-scoring sentences that fit the token budget, in their original order."""
+        token_budget = token_budget or self.token_budget
+        if estimate_tokens(context) <= token_budget:
+            return context
+
+        sentences = self.split_sentences(context)
+        if len(sentences) < 2:
+            return context
+
+        embeddings = self.embedding_model.encode([query] + sentences, batch_size=64, convert_to_numpy=True, normalize_embeddings=True)
+        # Embeddings are unit length, so the dot product is the cosine similarity
+        scores = embeddings[1:] @ embeddings[0]
+
+        selected, used = [], 0
+        for index in np.argsort(-scores):
+            cost = estimate_tokens(sentences[index])
+            if used + cost > token_budget:
+                continue
+            selected.append(index)
+            used += cost
+
+        if not selected:
+            return context[:token_budget * 4]
+        kept = ' '.join(sentences[i] for i in sorted(selected))
+        logger.info(f"Context selection kept {len(selected)}/{len(sentences)} sentences (~{used} of ~{estimate_tokens(context)} tokens).")
+        return kept
@@ -0,0 +1,137 @@
+import os
+import re
+import json
+import logging
+import importlib.util
+from pathlib import Path
+from typing import List, Optional
+import numpy as np
+from sentence_transformers import SentenceTransformer
+
+logger = logging.getLogger(__name__)
+
+# "torch" is the full-precision PyTorch model, "onnx" the same weights in ONNX Runtime,
+# and "onnx-int8" an ONNX export with dynamic int8 quantization of the weights.
+EMBEDDING_BACKENDS = ("torch", "onnx", "onnx-int8")
+
+# Sentences used to check an exported model against the PyTorch reference
+VALIDATION_SENTENCES = [
+    "What is the capital of France?",
+    "Pollachi is a town in the Coimbatore district of Tamil Nadu.",
+    "The Vermont Catamounts men's soccer team represents the University of Vermont.",
+    "Guns N' Roses performed a promotional concert for their album.",
+    "A medieval fortress overlooks the river valley below the village.",
+    "Large language models generate text one token at a time.",
+    "Seven Brief Lessons on Physics is a book by Carlo Rovelli.",
+    "How do vaccines train the immune system?",
+]
+
+def _set_torch_threads(threads: Optional[int]):
+    if threads:
+        import torch
+        torch.set_num_threads(threads)
+
+def _onnx_session_options(threads: Optional[int]):
+    import onnxruntime as ort
+    options = ort.SessionOptions()
+    if threads:
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    return options
+
+def cosine_agreement(candidate: SentenceTransformer, reference: SentenceTransformer,
+                     sentences: List[str] = VALIDATION_SENTENCES) -> float:
+    """Lowest cosine similarity between the two models' embeddings of the same sentences."""
+    a = candidate.encode(sentences, convert_to_numpy=True, normalize_embeddings=True)
+    b = reference.encode(sentences, convert_to_numpy=True, normalize_embeddings=True)
+    return float(np.min(np.sum(a * b, axis=1)))
+
+def _export_onnx(model_name: str, export_dir: Path, quantized: bool, quantization: str, threads: Optional[int]) -> SentenceTransformer:
+    """Exports (once) and loads the ONNX model, optionally quantized, from `export_dir`."""
+    from sentence_transformers import export_dynamic_quantized_onnx_model
+
+    if not (export_dir / "onnx" / "model.onnx").exists():
+        logger.info(f"Exporting '{model_name}' to ONNX in {export_dir}...")
+        SentenceTransformer(model_name, device="cpu", backend="onnx").save_pretrained(str(export_dir))
+        if not (export_dir / "onnx" / "model.onnx").exists():
+            # Only Transformer-module models export; CLIP's vision tower stays on PyTorch
+            raise ValueError("this model architecture is not supported by the ONNX backend")
+
+    file_name = "onnx/model.onnx"
+    if quantized:
+        file_name = f"onnx/model_qint8_{quantization}.onnx"
+        if not (export_dir / file_name).exists():
+            logger.info(f"Quantizing '{model_name}' to int8 ({quantization})...")
+            base = SentenceTransformer(str(export_dir), device="cpu", backend="onnx")
+            export_dynamic_quantized_onnx_model(base, quantization, str(export_dir))
+
+    return SentenceTransformer(str(export_dir), device="cpu", backend="onnx", model_kwargs={
+        "file_name": file_name,
+        "provider": "CPUExecutionProvider",
+        "session_options": _onnx_session_options(threads),
+    })
+
+def load_with_backend(model_name: str, backend: str, threads: Optional[int] = None,
+                      quantization: str = "avx2", min_agreement: float = 0.99,
+                      export_root: str = "data/onnx_models") -> SentenceTransformer:
+    """
+    Loads `model_name` with the requested backend. ONNX models are exported once under
+    `export_root` and validated against the PyTorch model on first use; if the export fails,
+    is unsupported for the architecture (e.g. CLIP), or falls below `min_agreement`
+    cosine similarity, the PyTorch model is used instead. A failed export leaves a marker
+    file in the export directory and is not retried on later starts until it is deleted.
+    """
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(f"Unknown embedding backend '{backend}'. Use one of {EMBEDDING_BACKENDS}.")
+    if backend == "torch":
+        _set_torch_threads(threads)
+        return SentenceTransformer(model_name, device="cpu")
+
+    export_dir = Path(export_root) / re.sub(r'[^\w\-.]', '_', model_name)
+    validation_path = export_dir / f"validation_{backend}_{quantization}.json"
+    failure_path = export_dir / f"export_failed_{backend}_{quantization}.json"
+    if importlib.util.find_spec("optimum") is None or importlib.util.find_spec("onnxruntime") is None:
+        logger.warning(f"The {backend} backend needs the packages in requirements-onnx.txt. Using PyTorch.")
+        _set_torch_threads(threads)
+        return SentenceTransformer(model_name, device="cpu")
+    if failure_path.exists():
+        logger.info(f"Skipping the {backend} export of '{model_name}', which failed before (delete {failure_path} to retry). Using PyTorch.")
+        _set_torch_threads(threads)
+        return SentenceTransformer(model_name, device="cpu")
+    try:
+        model = _export_onnx(model_name, export_dir, backend == "onnx-int8", quantization, threads)
+    except Exception as e:
+        logger.warning(f"ONNX backend unavailable for '{model_name}' ({e}). Using PyTorch.")
+        # An export that failed once fails the same way on every start, so remember it
+        export_dir.mkdir(parents=True, exist_ok=True)
+        failure_path.write_text(json.dumps({"model": model_name, "backend": backend, "error": str(e)}, indent=2))
+        _set_torch_threads(threads)
+        return SentenceTransformer(model_name, device="cpu")
+
+    if validation_path.exists():
+        validation = json.loads(validation_path.read_text())
+    else:
+        # The reference model is only loaded once per export, then released
+        _set_torch_threads(threads)
+        agreement = cosine_agreement(model, SentenceTransformer(model_name, device="cpu"))
+        validation = {"backend": backend, "quantization": quantization, "min_cosine": agreement}
+        validation_path.write_text(json.dumps(validation, indent=2))
+
+    if validation["min_cosine"] < min_agreement:
+        logger.warning(f"{backend} embeddings for '{model_name}' agree with PyTorch only to "
+                       f"{validation['min_cosine']:.4f} (< {min_agreement}). Using PyTorch.")
+        _set_torch_threads(threads)
+        return SentenceTransformer(model_name, device="cpu")
+
+    logger.info(f"Loaded '{model_name}' with the {backend} backend (min cosine vs PyTorch {validation['min_cosine']:.4f}).")
+    return model
+
+def backend_from_env() -> dict:
+    """Reads EMBEDDING_BACKEND, EMBEDDING_THREADS and EMBEDDING_QUANTIZATION."""
+    threads = os.getenv("EMBEDDING_THREADS")
+    return {
+        "backend": os.getenv("EMBEDDING_BACKEND", "torch"),
+        "threads": int(threads) if threads else None,
+        "quantization": os.getenv("EMBEDDING_QUANTIZATION", "avx2"),
+    }
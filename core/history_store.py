@@ -0,0 +1,282 @@
+import csv
+import json
+import time
+import queue
+import sqlite3
+import hashlib
+import logging
+import argparse
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS answers (
+    id INTEGER PRIMARY KEY,
+    created_at REAL NOT NULL,
+    kind TEXT NOT NULL,
+    query TEXT NOT NULL,
+    age_group TEXT,
+    summary TEXT NOT NULL,
+    source TEXT,
+    title TEXT,
+    model TEXT,
+    metadata TEXT,
+    dedupe_key TEXT NOT NULL UNIQUE
+);
+CREATE INDEX IF NOT EXISTS idx_answers_created ON answers (created_at, id);
+CREATE INDEX IF NOT EXISTS idx_answers_query ON answers (query, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_answers_age_group ON answers (age_group, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_answers_kind ON answers (kind, created_at, id);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS answers_fts USING fts5(
+    query, summary, content='answers', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS answers_ai AFTER INSERT ON answers BEGIN
+    INSERT INTO answers_fts (rowid, query, summary) VALUES (new.id, new.query, new.summary);
+END;
+CREATE TRIGGER IF NOT EXISTS answers_ad AFTER DELETE ON answers BEGIN
+    INSERT INTO answers_fts (answers_fts, rowid, query, summary) VALUES ('delete', old.id, old.query, old.summary);
+END;
+
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+INSERT_SQL = """
+INSERT OR IGNORE INTO answers (created_at, kind, query, age_group, summary, source, title, model, metadata, dedupe_key)
+VALUES (:created_at, :kind, :query, :age_group, :summary, :source, :title, :model, :metadata, :dedupe_key)
+"""
+
+# Listing returns a preview; the full summary comes from get()
+LIST_COLUMNS = "a.id, a.created_at, a.kind, a.query, a.age_group, substr(a.summary, 1, 240) AS preview, a.source, a.title"
+
+class HistoryStore:
+    """
+    Every answer the assistant has given, in one SQLite database (WAL mode) with indexes on
+    query, age group and time and an FTS5 index over queries and summaries.
+
+    `record()` never blocks the caller: rows go on a bounded queue and a writer thread inserts
+    them in batches. Listing and search use keyset pagination on (created_at, id), so a page
+    costs the same at row ten million as at row ten. On first start the writer also imports
+    the legacy data/summaries/*.json and data/summaries.csv files.
+    """
+    def __init__(self, db_path: str = "data/history.db", batch_size: int = 200, flush_interval: float = 0.5,
+                 max_pending: int = 10000, legacy_dir: Optional[str] = "data"):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.legacy_dir = legacy_dir
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+        self._queue: "queue.Queue[Optional[Dict]]" = queue.Queue(maxsize=max_pending)
+        self._writer = threading.Thread(target=self._write_loop, name="history-writer", daemon=True)
+        self._writer.start()
+        metrics.gauge_callback("history_write_queue_depth", lambda: {(): self._queue.qsize()})
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _reader(self) -> sqlite3.Connection:
+        # One connection per reading thread; WAL lets readers run alongside the writer
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    @staticmethod
+    def _row(kind: str, query: str, summary: str, age_group: Optional[str] = None, source: Optional[str] = None,
+             title: Optional[str] = None, model: Optional[str] = None, metadata: Optional[Dict] = None,
+             created_at: Optional[float] = None, dedupe_on_content: bool = False) -> Dict:
+        created_at = created_at if created_at is not None else time.time()
+        # Imported rows are keyed on content alone, since the JSON and CSV copies of one answer
+        # carry slightly different timestamps; live answers keep one row per time asked
+        stamp = "" if dedupe_on_content else f"{created_at:.6f}"
+        key = hashlib.sha256(f"{kind}\0{query}\0{age_group}\0{stamp}\0{summary}".encode("utf-8")).hexdigest()
+        return {
+            "created_at": created_at, "kind": kind, "query": query, "age_group": age_group, "summary": summary,
+            "source": source, "title": title, "model": model,
+            "metadata": json.dumps(metadata) if metadata else None, "dedupe_key": key,
+        }
+
+    def record(self, kind: str, query: str, summary: str, **fields) -> bool:
+        """Queues an answer for writing. Returns False (and drops it) if the writer is too far behind."""
+        try:
+            self._queue.put_nowait(self._row(kind, query, summary, **fields))
+            return True
+        except queue.Full:
+            metrics.inc("history_dropped_total")
+            logger.warning("History write queue is full. Dropping an answer.")
+            return False
+
+    def _write_loop(self):
+        conn = self._connect()
+        if self.legacy_dir:
+            try:
+                self.import_legacy(self.legacy_dir, conn=conn)
+            except Exception as e:
+                logger.error(f"Importing legacy summaries failed: {e}")
+        stopping = False
+        while not stopping:
+            try:
+                first = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            batch = [first]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            rows = [row for row in batch if row is not None]
+            stopping = len(rows) < len(batch)
+            try:
+                if rows:
+                    with conn:
+                        conn.executemany(INSERT_SQL, rows)
+                    metrics.inc("history_writes_total", len(rows))
+            except sqlite3.Error as e:
+                logger.error(f"Writing {len(rows)} history rows failed: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+        conn.close()
+
+    def flush(self):
+        """Blocks until every queued answer has been written."""
+        self._queue.join()
+
+    def close(self):
+        self._queue.put(None)
+        self._writer.join()
+
+    @staticmethod
+    def _format(row: sqlite3.Row) -> Dict:
+        item = dict(row)
+        item["created_at"] = datetime.fromtimestamp(item["created_at"]).isoformat()
+        if item.get("metadata"):
+            item["metadata"] = json.loads(item["metadata"])
+        return item
+
+    @staticmethod
+    def _encode_cursor(row: sqlite3.Row) -> str:
+        return f"{row['created_at']!r}:{row['id']}"
+
+    @staticmethod
+    def _decode_cursor(cursor: str) -> Tuple[float, int]:
+        created_at, row_id = cursor.rsplit(":", 1)
+        return float(created_at), int(row_id)
+
+    def _page(self, sql: str, params: List, cursor: Optional[str], limit: int) -> Dict:
+        if cursor:
+            sql += " AND (a.created_at, a.id) < (?, ?)"
+            params += list(self._decode_cursor(cursor))
+        sql += " ORDER BY a.created_at DESC, a.id DESC LIMIT ?"
+        rows = self._reader().execute(sql, params + [limit + 1]).fetchall()
+        next_cursor = self._encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+        return {"items": [self._format(row) for row in rows[:limit]], "next_cursor": next_cursor}
+
+    def list(self, limit: int = 20, cursor: Optional[str] = None, age_group: Optional[str] = None,
+             kind: Optional[str] = None, query: Optional[str] = None) -> Dict:
+        """Newest answers first, optionally filtered. Pass the returned `next_cursor` to get the next page."""
+        sql, params = f"SELECT {LIST_COLUMNS} FROM answers a WHERE 1=1", []
+        for column, value in (("age_group", age_group), ("kind", kind), ("query", query)):
+            if value is not None:
+                sql += f" AND a.{column} = ?"
+                params.append(value)
+        return self._page(sql, params, cursor, limit)
+
+    def search(self, text: str, limit: int = 20, cursor: Optional[str] = None, age_group: Optional[str] = None) -> Dict:
+        """Full-text search over queries and summaries, newest first. Every word must match."""
+        terms = text.split()
+        if not terms:
+            return {"items": [], "next_cursor": None}
+        match = " ".join('"' + term.replace('"', '""') + '"' for term in terms)
+        sql = f"SELECT {LIST_COLUMNS} FROM answers_fts JOIN answers a ON a.id = answers_fts.rowid WHERE answers_fts MATCH ?"
+        params: List = [match]
+        if age_group is not None:
+            sql += " AND a.age_group = ?"
+            params.append(age_group)
+        return self._page(sql, params, cursor, limit)
+
+    def get(self, answer_id: int) -> Optional[Dict]:
+        row = self._reader().execute("SELECT * FROM answers WHERE id = ?", (answer_id,)).fetchone()
+        if row is None: return None
+        item = self._format(row)
+        item.pop("dedupe_key", None)
+        return item
+
+    def import_legacy(self, data_dir: str = "data", force: bool = False, conn: Optional[sqlite3.Connection] = None) -> Dict[str, int]:
+        """
+        One-shot import of the legacy summary files. Rows are keyed on their content, so a
+        forced re-run does not create duplicates. The files themselves are left in place.
+        """
+        conn = conn or self._connect()
+        if not force and conn.execute("SELECT 1 FROM meta WHERE key = 'legacy_import_done'").fetchone():
+            return {}
+        data = Path(data_dir)
+        rows, counts = [], {"json": 0, "csv": 0}
+
+        def parse_time(value: Optional[str], fallback: float) -> float:
+            try:
+                return datetime.fromisoformat(value).timestamp()
+            except (TypeError, ValueError):
+                return fallback
+
+        for path in sorted((data / "summaries").glob("*.json")):
+            try:
+                item = json.loads(path.read_text(encoding="utf-8"))
+            except (OSError, ValueError) as e:
+                logger.warning(f"Skipping unreadable summary {path.name}: {e}")
+                continue
+            metadata = item.get("metadata") or {}
+            rows.append(self._row(
+                "search", item.get("query", path.stem), item.get("summary", ""), age_group=item.get("age_group"),
+                source=metadata.get("source"), title=metadata.get("title"), model=item.get("model"),
+                metadata=metadata, created_at=parse_time(item.get("timestamp"), path.stat().st_mtime),
+                dedupe_on_content=True,
+            ))
+            counts["json"] += 1
+
+        csv_path = data / "summaries.csv"
+        if csv_path.exists():
+            with open(csv_path, newline="", encoding="utf-8") as f:
+                for item in csv.DictReader(f):
+                    rows.append(self._row(
+                        "search", item.get("query", ""), item.get("summary", ""), age_group=item.get("age_group"),
+                        source=item.get("source"), title=item.get("title"),
+                        created_at=parse_time(item.get("timestamp"), csv_path.stat().st_mtime),
+                        dedupe_on_content=True,
+                    ))
+                    counts["csv"] += 1
+
+        rows.sort(key=lambda row: row["created_at"])
+        # data/text_summaries only holds download copies of answers, so it is not imported
+        count_rows = lambda: conn.execute("SELECT count(*) FROM answers").fetchone()[0]
+        before = count_rows()
+        with conn:
+            conn.executemany(INSERT_SQL, rows)
+            counts["imported"] = count_rows() - before
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('legacy_import_done', ?)", (str(time.time()),))
+        logger.info(f"Imported legacy history: {counts}")
+        return counts
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import legacy summary files into the history database.")
+    parser.add_argument("--db", default="data/history.db")
+    parser.add_argument("--data-dir", default="data")
+    parser.add_argument("--force", action="store_true", help="Import again even if an import already ran.")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    store = HistoryStore(args.db, legacy_dir=None)
+    print(store.import_legacy(args.data_dir, force=args.force))
+    store.close()
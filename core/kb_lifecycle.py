@@ -0,0 +1,283 @@
+import os
+import json
+import time
+import asyncio
+import logging
+import threading
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+import aiohttp
+from core.metrics import metrics, stage
+from core.rag_system import TextRAGSystem
+
+logger = logging.getLogger(__name__)
+
+# Stale web documents are either re-fetched or dropped
+STALE_ACTIONS = ("refresh", "evict")
+
+class KBLifecycleManager:
+    """
+    Keeps the text knowledge base fresh and bounded. A background sweeper periodically:
+
+    - writes buffered search hits to each document's `last_hit_at`,
+    - handles web-learned documents older than `ttl_days`: ones hit within the TTL are
+      re-fetched from their source URL (up to `refresh_batch` per sweep), the rest are evicted,
+    - evicts the least recently hit documents while the collection exceeds `max_documents`,
+    - rebuilds the collection once `compact_after_deletes` documents were removed or
+      `compact_interval` seconds have passed, since Chroma's HNSW index does not reclaim
+      space from deleted entries.
+
+    Compaction copies the live documents, with their stored embeddings, into a new
+    collection, then swaps it in under the RAG system's lock. The old collection is renamed
+    and only dropped on the next sweep, so searches already holding it can finish. The time of
+    the last compaction and any swap in progress are kept in `state_path` (next to the Chroma
+    database by default), so restarts neither postpone compaction nor lose a half-done swap.
+    """
+    def __init__(self, rag_system: TextRAGSystem, web_fetcher=None, ttl_days: float = 30.0,
+                 stale_action: str = "refresh", max_documents: int = 50000, sweep_interval: float = 3600.0,
+                 refresh_batch: int = 20, compact_after_deletes: int = 1000, compact_interval: float = 7 * 86400.0,
+                 page_size: int = 1000, on_swap: Optional[Callable] = None, state_path: Optional[str] = None):
+        if stale_action not in STALE_ACTIONS:
+            raise ValueError(f"Unknown stale action '{stale_action}'. Use one of {STALE_ACTIONS}.")
+        self.rag = rag_system
+        self.web_fetcher = web_fetcher
+        self.ttl = ttl_days * 86400
+        self.stale_action = stale_action if web_fetcher is not None else "evict"
+        self.max_documents = max_documents
+        self.sweep_interval = sweep_interval
+        self.refresh_batch = refresh_batch
+        self.compact_after_deletes = compact_after_deletes
+        self.compact_interval = compact_interval
+        self.page_size = page_size
+        # Called with the new collection after a compaction swap (e.g. to re-attach the keyword extractor)
+        self.on_swap = on_swap
+        self.state_path = Path(state_path or Path(rag_system.db_path) / "kb_lifecycle.json")
+        state = self._load_state()
+        self.deleted_since_compaction = state.get("deleted_since_compaction", 0)
+        self.last_compaction = state.get("last_compaction") or time.time()
+        if "last_compaction" not in state:
+            self._save_state()
+        self._retired: List[str] = []
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        metrics.gauge_callback("kb_documents", lambda: {(): self.rag.collection.count()})
+
+    def start(self):
+        if self._thread is not None: return
+        self._recover_collections()
+        self._thread = threading.Thread(target=self._run, name="kb-lifecycle", daemon=True)
+        self._thread.start()
+        logger.info(f"KB lifecycle sweeper started (every {self.sweep_interval:.0f}s, TTL {self.ttl / 86400:.0f} days, "
+                    f"max {self.max_documents} documents).")
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.rag.flush_hits()
+
+    def _run(self):
+        while not self._stop.wait(self.sweep_interval):
+            try:
+                self.sweep()
+            except Exception as e:
+                logger.error(f"KB lifecycle sweep failed: {e}")
+
+    def _load_state(self) -> Dict:
+        try:
+            return json.loads(self.state_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return {}
+
+    def _save_state(self, swap: Optional[Dict] = None):
+        state = {"last_compaction": self.last_compaction, "deleted_since_compaction": self.deleted_since_compaction}
+        if swap:
+            state["swap"] = swap
+        self.state_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.state_path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(state), encoding="utf-8")
+        tmp_path.replace(self.state_path)
+
+    def _collection_names(self) -> List[str]:
+        # Chroma returns names from 0.6 on and Collection objects before that
+        return [getattr(c, "name", c) for c in self.rag.client.list_collections()]
+
+    def _recover_collections(self):
+        """
+        Restores the original collection if the process stopped between the two renames of a
+        swap (recorded in the state file), then drops leftover retired and rebuild collections.
+        """
+        swap = self._load_state().get("swap")
+        names = self._collection_names()
+        if swap and swap["retired"] in names and swap["rebuild"] in names:
+            logger.warning(f"Restoring '{swap['retired']}' after an interrupted compaction.")
+            with self.rag.lock:
+                if self.rag.collection_name in names:
+                    # Created empty by TextRAGSystem on startup
+                    self.rag.client.delete_collection(self.rag.collection_name)
+                restored = self.rag.client.get_collection(swap["retired"])
+                restored.modify(name=self.rag.collection_name)
+                self.rag.collection = restored
+        if swap:
+            self._save_state()
+        prefixes = (f"{self.rag.collection_name}_retired_", f"{self.rag.collection_name}_rebuild_")
+        for name in self._collection_names():
+            if name.startswith(prefixes):
+                self.rag.client.delete_collection(name)
+
+    def _iter_metadata(self):
+        collection, offset = self.rag.collection, 0
+        while True:
+            page = collection.get(include=["metadatas"], limit=self.page_size, offset=offset)
+            if not page["ids"]: return
+            yield from zip(page["ids"], page["metadatas"])
+            offset += len(page["ids"])
+
+    def _delete(self, ids: List[str], reason: str):
+        for start in range(0, len(ids), self.page_size):
+            with self.rag.lock:
+                self.rag.collection.delete(ids=ids[start:start + self.page_size])
+        self.deleted_since_compaction += len(ids)
+        self._save_state()
+        metrics.inc("kb_evictions_total", len(ids), reason=reason)
+        logger.info(f"Evicted {len(ids)} knowledge-base documents ({reason}).")
+
+    def sweep(self) -> Dict[str, int]:
+        """Runs one full lifecycle pass and returns what it did."""
+        report = {"hits_flushed": self.rag.flush_hits(), "backfilled": 0, "refreshed": 0, "evicted_stale": 0,
+                  "evicted_lru": 0, "compacted": 0}
+        for name in self._retired:
+            self.rag.client.delete_collection(name)
+        self._retired = []
+
+        now = time.time()
+        # Keyed by id, since concurrent inserts can shift offset-based pages
+        documents, backfill = {}, {}
+        with stage("kb_sweep"):
+            for doc_id, metadata in self._iter_metadata():
+                metadata = metadata or {}
+                if "added_at" not in metadata:
+                    # Documents added before lifecycle tracking start their clock now
+                    source = str(metadata.get("source", ""))
+                    metadata = {**metadata, "added_at": now, "last_hit_at": now,
+                                "source_type": "web" if source.startswith("http") else "unknown"}
+                    backfill[doc_id] = metadata
+                documents[doc_id] = metadata
+            if backfill:
+                ids = list(backfill)
+                for start in range(0, len(ids), self.page_size):
+                    batch = ids[start:start + self.page_size]
+                    with self.rag.lock:
+                        self.rag.collection.update(ids=batch, metadatas=[backfill[i] for i in batch])
+                report["backfilled"] = len(backfill)
+
+            stale = [(doc_id, m) for doc_id, m in documents.items()
+                     if m.get("source_type") == "web" and now - m["added_at"] > self.ttl]
+            # Stale documents that are still being hit are re-fetched; the rest are evicted
+            popular = [(doc_id, m) for doc_id, m in stale
+                       if self.stale_action == "refresh" and now - m.get("last_hit_at", 0) <= self.ttl]
+            popular_ids = {doc_id for doc_id, _ in popular}
+            # Popular documents beyond this sweep's refresh budget wait for the next sweep
+            to_refresh = popular[:self.refresh_batch]
+            refreshed = set(self._refresh(to_refresh)) if to_refresh else set()
+            evict = [doc_id for doc_id, _ in stale if doc_id not in popular_ids]
+            evict += [doc_id for doc_id, _ in to_refresh if doc_id not in refreshed]
+            if evict:
+                self._delete(evict, "ttl")
+            report["refreshed"], report["evicted_stale"] = len(refreshed), len(evict)
+
+            gone = set(evict)
+            live = [(doc_id, m) for doc_id, m in documents.items() if doc_id not in gone]
+            overflow = len(live) - self.max_documents
+            if overflow > 0:
+                live.sort(key=lambda item: item[1].get("last_hit_at", 0))
+                self._delete([doc_id for doc_id, _ in live[:overflow]], "max_size")
+                report["evicted_lru"] = overflow
+
+        if (self.deleted_since_compaction >= self.compact_after_deletes
+                or time.time() - self.last_compaction >= self.compact_interval):
+            report["compacted"] = self.compact()
+        logger.info(f"KB lifecycle sweep: {report}")
+        return report
+
+    def _refresh(self, documents: List[tuple]) -> List[str]:
+        """Re-fetches stale documents from their source URLs and returns the ids that were updated."""
+        async def fetch_all():
+            async with aiohttp.ClientSession() as session:
+                results = []
+                for doc_id, metadata in documents:
+                    link = {"href": metadata["source"], "title": metadata.get("title", "")}
+                    result = await self.web_fetcher.fetch_and_parse_best_result(link["title"], links=[link], session=session)
+                    results.append((doc_id, metadata, result))
+                return results
+
+        refreshed = []
+        for doc_id, metadata, result in asyncio.run(fetch_all()):
+            if not result:
+                metrics.inc("kb_refreshes_total", outcome="failed")
+                continue
+            # The document keeps its hit history but gets a new added_at
+            result["metadata"] = {**result["metadata"], "source_type": "web", "last_hit_at": metadata.get("last_hit_at", time.time())}
+            self.rag.add_documents([result])
+            metrics.inc("kb_refreshes_total", outcome="ok")
+            refreshed.append(doc_id)
+        return refreshed
+
+    def compact(self) -> int:
+        """Rebuilds the collection into a fresh HNSW index and swaps it in. Returns the document count."""
+        old = self.rag.collection
+        started_at = time.time()
+        rebuild_name = f"{self.rag.collection_name}_rebuild_{int(started_at)}"
+        new = self.rag.client.create_collection(name=rebuild_name, metadata=old.metadata or None)
+        with stage("kb_compact"):
+            offset = 0
+            while True:
+                page = old.get(include=["embeddings", "documents", "metadatas"], limit=self.page_size, offset=offset)
+                if not page["ids"]: break
+                new.upsert(ids=page["ids"], embeddings=page["embeddings"], documents=page["documents"], metadatas=page["metadatas"])
+                offset += len(page["ids"])
+
+            with self.rag.lock:
+                # Writes that landed during the copy; nothing else deletes while the sweeper runs
+                delta = old.get(where={"added_at": {"$gte": started_at}}, include=["embeddings", "documents", "metadatas"])
+                if delta["ids"]:
+                    new.upsert(ids=delta["ids"], embeddings=delta["embeddings"], documents=delta["documents"], metadatas=delta["metadatas"])
+                retired_name = f"{self.rag.collection_name}_retired_{int(started_at)}"
+                self._save_state(swap={"retired": retired_name, "rebuild": rebuild_name})
+                old.modify(name=retired_name)
+                new.modify(name=self.rag.collection_name)
+                self.rag.collection = new
+                self.deleted_since_compaction = 0
+                self.last_compaction = time.time()
+                self._save_state()
+            self._retired.append(retired_name)
+
+        count = new.count()
+        metrics.inc("kb_compactions_total")
+        logger.info(f"Compacted knowledge base into a fresh index with {count} documents.")
+        if self.on_swap:
+            self.on_swap(new)
+        return count
+
+def _env_float(name: str, default: float) -> float:
+    value = os.getenv(name)
+    return float(value) if value else default
+
+def kb_lifecycle_from_env(rag_system: TextRAGSystem, web_fetcher=None, on_swap: Optional[Callable] = None) -> Optional[KBLifecycleManager]:
+    """
+    Builds the manager from KB_TTL_DAYS, KB_STALE_ACTION, KB_MAX_DOCUMENTS, KB_SWEEP_INTERVAL (seconds),
+    KB_COMPACT_AFTER_DELETES and KB_COMPACT_INTERVAL_HOURS. KB_LIFECYCLE_ENABLED=0 turns it off.
+    """
+    if os.getenv("KB_LIFECYCLE_ENABLED", "1") == "0":
+        return None
+    return KBLifecycleManager(
+        rag_system, web_fetcher,
+        ttl_days=_env_float("KB_TTL_DAYS", 30.0),
+        stale_action=os.getenv("KB_STALE_ACTION", "refresh"),
+        max_documents=int(_env_float("KB_MAX_DOCUMENTS", 50000)),
+        sweep_interval=_env_float("KB_SWEEP_INTERVAL", 3600.0),
+        compact_after_deletes=int(_env_float("KB_COMPACT_AFTER_DELETES", 1000)),
+        compact_interval=_env_float("KB_COMPACT_INTERVAL_HOURS", 168.0) * 3600,
+        on_swap=on_swap,
+    )
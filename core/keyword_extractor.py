@@ -0,0 +1,109 @@
+import math
+import time
+import logging
+import threading
+import numpy as np
+from collections import Counter
+from typing import Iterable, List, Optional
+from sklearn.feature_extraction.text import CountVectorizer
+from core.rag_system import load_embedding_model, TEXT_EMBEDDING_MODEL
+
+logger = logging.getLogger(__name__)
+
+class KeywordExtractor:
+    """
+    Local keyphrase extraction: TF-IDF picks candidate phrases, then Maximal Marginal
+    Relevance over MiniLM embeddings chooses ones that are relevant but not redundant.
+    Document frequencies are updated incrementally as the RAG store grows.
+    """
+    def __init__(self, embedding_model=None, ngram_range: tuple = (1, 3), candidates: int = 30,
+                 diversity: float = 0.5, refresh_interval: float = 300.0):
+        self.embedding_model = embedding_model or load_embedding_model(TEXT_EMBEDDING_MODEL)
+        self.analyzer = CountVectorizer(ngram_range=ngram_range, stop_words='english').build_analyzer()
+        self.candidates = candidates
+        self.diversity = diversity
+        self.refresh_interval = refresh_interval
+        self.document_frequency = Counter()
+        self.document_count = 0
+        self._seen_ids = set()
+        self._collection = None
+        self._last_refresh = 0.0
+        self._lock = threading.Lock()
+        # Held for a whole refresh, so only one runs at a time; it also guards _seen_ids
+        self._refresh_lock = threading.Lock()
+
+    def partial_fit(self, texts: Iterable[str]):
+        """Adds documents to the IDF statistics without refitting on the whole corpus."""
+        counts = Counter()
+        added = 0
+        for text in texts:
+            counts.update(set(self.analyzer(text)))
+            added += 1
+        with self._lock:
+            self.document_frequency.update(counts)
+            self.document_count += added
+
+    def attach_collection(self, collection, batch_size: int = 500):
+        """Fits on a Chroma collection now and keeps picking up its new documents on later calls."""
+        self._collection = collection
+        self._batch_size = batch_size
+        self.refresh()
+
+    def refresh(self, blocking: bool = True):
+        """Fits only the collection documents that have not been seen yet. With `blocking=False` it returns at once if a refresh is already running."""
+        if self._collection is None: return
+        if not self._refresh_lock.acquire(blocking=blocking): return
+        try:
+            self._last_refresh = time.monotonic()
+            new_ids = [i for i in self._collection.get(include=[])['ids'] if i not in self._seen_ids]
+            for start in range(0, len(new_ids), self._batch_size):
+                batch = new_ids[start:start + self._batch_size]
+                documents = self._collection.get(ids=batch, include=['documents'])['documents']
+                self.partial_fit(doc for doc in documents if doc)
+                self._seen_ids.update(batch)
+            if new_ids:
+                logger.info(f"Keyword extractor fitted {len(new_ids)} new documents. Corpus size: {self.document_count}")
+        except Exception as e:
+            logger.error(f"Refreshing keyword statistics failed: {e}")
+        finally:
+            self._refresh_lock.release()
+
+    def _refresh_in_background(self):
+        if self._collection is None or self._refresh_lock.locked(): return
+        if time.monotonic() - self._last_refresh <= self.refresh_interval: return
+        # Marked now so later calls do not start more threads while this one scans the collection
+        self._last_refresh = time.monotonic()
+        threading.Thread(target=self.refresh, kwargs={"blocking": False}, name="keyword-refresh", daemon=True).start()
+
+    def _idf(self, term: str) -> float:
+        # Smoothed IDF, matching scikit-learn's TfidfTransformer(smooth_idf=True)
+        return math.log((1 + self.document_count) / (1 + self.document_frequency.get(term, 0))) + 1
+
+    def extract(self, text: str, top_n: int = 5, diversity: Optional[float] = None) -> List[str]:
+        """Returns up to `top_n` keyphrases for `text`."""
+        # Statistics catch up with the collection off the request path; this call uses what is there now
+        self._refresh_in_background()
+        term_counts = Counter(self.analyzer(text))
+        if not term_counts: return []
+
+        with self._lock:
+            scored = sorted(((count * self._idf(term), term) for term, count in term_counts.items()), reverse=True)
+        candidates = [term for _, term in scored[:self.candidates]]
+        if len(candidates) <= top_n: return candidates
+
+        # MiniLM only reads the first ~256 tokens, so the head of the document stands in for it
+        embeddings = self.embedding_model.encode([text[:2000]] + candidates, convert_to_numpy=True, normalize_embeddings=True)
+        doc_similarity = embeddings[1:] @ embeddings[0]
+        candidate_similarity = embeddings[1:] @ embeddings[1:].T
+
+        diversity = self.diversity if diversity is None else diversity
+        selected = [int(np.argmax(doc_similarity))]
+        remaining = set(range(len(candidates))) - set(selected)
+        while remaining and len(selected) < top_n:
+            options = np.array(sorted(remaining))
+            redundancy = candidate_similarity[np.ix_(options, selected)].max(axis=1)
+            mmr = (1 - diversity) * doc_similarity[options] - diversity * redundancy
+            best = int(options[np.argmax(mmr)])
+            selected.append(best)
+            remaining.discard(best)
+        return [candidates[i] for i in selected]
@@ -0,0 +1,368 @@
+import os
+import time
+import random
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+from groq import Groq
+from core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+# Groq's free-tier quotas (requests:tokens per minute) for the models this app calls.
+# GROQ_LIMITS replaces them; models not listed use GROQ_RPM and GROQ_TPM.
+DEFAULT_MODEL_LIMITS = "llama-3.1-8b-instant=30:6000;meta-llama/llama-4-scout-17b-16e-instruct=30:30000"
+
+class LLMUnavailableError(RuntimeError):
+    """Raised when a model cannot be called because the gateway is unconfigured, its circuit is open or its rate limit is exhausted."""
+
+class TokenBucket:
+    """A thread-safe token bucket that refills continuously up to `capacity` tokens per minute."""
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.tokens = float(per_minute)
+        self.refill_rate = per_minute / 60.0
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, amount: float = 1.0, timeout: Optional[float] = None) -> float:
+        """
+        Blocks until `amount` tokens are available and returns how long the caller waited.
+        Raises LLMUnavailableError straight away if the tokens cannot be available within `timeout` seconds.
+        """
+        # A single request larger than the bucket would otherwise wait forever
+        amount = min(amount, self.capacity)
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.refill_rate)
+                self.updated_at = now
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return waited
+                delay = (amount - self.tokens) / self.refill_rate
+            if timeout is not None and waited + delay > timeout:
+                raise LLMUnavailableError(f"Rate limit would delay this call by {waited + delay:.1f}s (limit {timeout:.1f}s).")
+            time.sleep(delay)
+            waited += delay
+
+    def settle(self, amount: float):
+        """Takes `amount` more tokens (or returns them, if negative) once a call's real cost is known."""
+        with self.lock:
+            self.tokens = min(self.capacity, self.tokens - amount)
+
+class CircuitBreaker:
+    """Opens after consecutive failures and lets a single probe through once `reset_timeout` has passed."""
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.probe_in_flight = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None: return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout: return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        with self.lock:
+            state = self.state
+            if state == "closed": return True
+            if state == "half_open" and not self.probe_in_flight:
+                self.probe_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.failures, self.opened_at, self.probe_in_flight = 0, None, False
+
+    def release_probe(self):
+        """Frees a half-open probe slot without counting the call for or against the circuit."""
+        with self.lock:
+            self.probe_in_flight = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            self.probe_in_flight = False
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+class ModelStats:
+    """Rolling latency and error counters for one model."""
+    def __init__(self, window: int = 500):
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self.hedged = 0
+        self.fallbacks = 0
+        self.latencies = deque(maxlen=window)
+        self.lock = threading.Lock()
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self.lock:
+            ordered = sorted(self.latencies)
+            def pct(p: float) -> Optional[float]:
+                return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))], 4) if ordered else None
+            return {
+                "requests": self.requests, "errors": self.errors, "retries": self.retries,
+                "rate_limited": self.rate_limited, "hedged": self.hedged, "fallbacks": self.fallbacks,
+                "latency_p50": pct(0.50), "latency_p95": pct(0.95), "latency_p99": pct(0.99),
+            }
+
+class LLMGateway:
+    """
+    The single entry point for Groq calls. Every model gets its own RPM/TPM token buckets
+    (sized from `model_limits`, else `rpm`/`tpm`), a circuit breaker and latency stats. Transient failures (429, 5xx, timeouts) are retried
+    with jittered exponential backoff, and a slow call can be hedged with a fallback model.
+
+    Calls are charged the prompt plus `expected_completion_tokens` up front and settled
+    against the reported usage afterwards, so a large `max_tokens` does not reserve tokens
+    that are never generated. Calls block the calling thread while they wait for rate-limit tokens (at most
+    `max_queue_wait` seconds) and for the API, so async callers must run them via asyncio.to_thread.
+    """
+    def __init__(self, api_key: Optional[str] = None, rpm: int = 30, tpm: int = 6000,
+                 max_retries: int = 3, base_backoff: float = 0.5, max_backoff: float = 8.0,
+                 failure_threshold: int = 5, reset_timeout: float = 30.0,
+                 fallback_models: Optional[Dict[str, str]] = None, hedge_after: Optional[float] = None,
+                 max_queue_wait: float = 20.0, model_limits: Optional[Dict[str, tuple]] = None,
+                 expected_completion_tokens: int = 512):
+        api_key = api_key or os.getenv("GROQ_API_KEY")
+        # Retries are handled here, so the SDK's own retry loop is disabled
+        self.client = Groq(api_key=api_key, max_retries=0) if api_key else None
+        if not self.client:
+            logger.error("GROQ_API_KEY not found in environment variables. LLM gateway is unavailable.")
+        self.rpm, self.tpm = rpm, tpm
+        # Maps a model to its own (rpm, tpm), since Groq quotas differ per model
+        self.model_limits = model_limits or {}
+        self.expected_completion_tokens = expected_completion_tokens
+        self.max_retries = max_retries
+        self.base_backoff, self.max_backoff = base_backoff, max_backoff
+        self.failure_threshold, self.reset_timeout = failure_threshold, reset_timeout
+        # Maps a primary model to the smaller model used when it is slow or failing
+        self.fallback_models = fallback_models or {}
+        self.hedge_after = hedge_after
+        self.max_queue_wait = max_queue_wait
+        self._buckets: Dict[str, tuple] = {}
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._stats: Dict[str, ModelStats] = {}
+        self._registry_lock = threading.Lock()
+        self._hedge_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="llm-hedge")
+
+    @property
+    def available(self) -> bool:
+        return self.client is not None
+
+    def limits_for(self, model: str) -> tuple:
+        """The (requests, tokens) per minute allowed for `model`."""
+        return self.model_limits.get(model, (self.rpm, self.tpm))
+
+    def _for_model(self, model: str):
+        with self._registry_lock:
+            if model not in self._stats:
+                rpm, tpm = self.limits_for(model)
+                self._buckets[model] = (TokenBucket(rpm), TokenBucket(tpm))
+                self._breakers[model] = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+                self._stats[model] = ModelStats()
+            return self._buckets[model], self._breakers[model], self._stats[model]
+
+    def _count(self, model: str, field: str):
+        stats = self._for_model(model)[2]
+        with stats.lock:
+            setattr(stats, field, getattr(stats, field) + 1)
+
+    def _estimate_tokens(self, messages: List[Dict[str, Any]], max_tokens: Optional[int]) -> int:
+        chars = 0
+        for message in messages:
+            content = message.get("content", "")
+            if isinstance(content, list):
+                chars += sum(len(part.get("text", "")) for part in content if isinstance(part, dict))
+            else:
+                chars += len(str(content))
+        # Replies rarely use all of max_tokens; the difference is settled once usage is known
+        return chars // 4 + min(max_tokens or self.expected_completion_tokens, self.expected_completion_tokens)
+
+    @staticmethod
+    def _retry_after(error: Exception) -> Optional[float]:
+        response = getattr(error, "response", None)
+        value = response.headers.get("retry-after") if response is not None else None
+        try:
+            return float(value) if value else None
+        except ValueError:
+            return None
+
+    @staticmethod
+    def _is_retryable(error: Exception) -> bool:
+        status = getattr(error, "status_code", None)
+        if status is not None:
+            return status in RETRYABLE_STATUS_CODES
+        # Connection resets and timeouts carry no status code
+        return type(error).__name__ in {"APIConnectionError", "APITimeoutError"}
+
+    def _call(self, model: str, request, token_cost: int):
+        """Runs `request()` under the model's rate limits, circuit breaker and retry policy."""
+        if not self.available:
+            raise LLMUnavailableError("The LLM service is not configured.")
+        (request_bucket, token_bucket), breaker, stats = self._for_model(model)
+        if not breaker.allow():
+            raise LLMUnavailableError(f"Circuit for model '{model}' is open after repeated failures.")
+
+        for attempt in range(self.max_retries + 1):
+            # Callers blocked on the rate limiter form the gateway's queue
+            metrics.add_gauge("llm_requests_waiting", 1, model=model)
+            try:
+                waited = request_bucket.acquire(1, timeout=self.max_queue_wait)
+                token_bucket.acquire(token_cost, timeout=self.max_queue_wait - waited)
+            except LLMUnavailableError:
+                breaker.release_probe()
+                raise
+            finally:
+                metrics.add_gauge("llm_requests_waiting", -1, model=model)
+            start = time.monotonic()
+            metrics.add_gauge("llm_requests_in_flight", 1, model=model)
+            try:
+                result = request()
+            except Exception as e:
+                metrics.add_gauge("llm_requests_in_flight", -1, model=model)
+                status = getattr(e, "status_code", None)
+                metrics.inc("llm_requests_total", model=model, outcome=str(status or type(e).__name__))
+                with stats.lock:
+                    stats.requests += 1
+                    stats.errors += 1
+                    stats.rate_limited += status == 429
+                if not self._is_retryable(e):
+                    # Bad requests (400, 413, ...) say nothing about the model's health
+                    breaker.release_probe()
+                    raise
+                if attempt == self.max_retries:
+                    breaker.record_failure()
+                    raise
+                # A huge Retry-After would hold this thread longer than the caller can use
+                delay = min(self._retry_after(e) or random.uniform(0, self.base_backoff * 2 ** attempt), self.max_backoff)
+                logger.warning(f"Retrying '{model}' in {delay:.2f}s after error (attempt {attempt + 1}/{self.max_retries}): {e}")
+                with stats.lock:
+                    stats.retries += 1
+                time.sleep(delay)
+                continue
+            metrics.add_gauge("llm_requests_in_flight", -1, model=model)
+            latency = time.monotonic() - start
+            metrics.inc("llm_requests_total", model=model, outcome="ok")
+            metrics.observe("llm_request_duration_seconds", latency, model=model)
+            with stats.lock:
+                stats.requests += 1
+                stats.latencies.append(latency)
+            breaker.record_success()
+            used = getattr(getattr(result, "usage", None), "total_tokens", None)
+            if used is not None:
+                token_bucket.settle(used - token_cost)
+            return result
+
+    def chat(self, messages: List[Dict[str, Any]], model: str, fallback_model: Optional[str] = None,
+             hedge_after: Optional[float] = None, **kwargs):
+        """
+        Creates a chat completion. If `hedge_after` seconds pass without a reply and a fallback
+        model is configured, the same request is sent to the fallback and the first reply wins.
+        If the primary model's circuit is open the fallback is used directly.
+        """
+        fallback_model = fallback_model or self.fallback_models.get(model)
+        hedge_after = hedge_after if hedge_after is not None else self.hedge_after
+        token_cost = self._estimate_tokens(messages, kwargs.get("max_tokens"))
+
+        def request_for(target: str):
+            return lambda: self._call(
+                target, lambda: self.client.chat.completions.create(messages=messages, model=target, **kwargs), token_cost
+            )
+
+        if not fallback_model or fallback_model == model:
+            return request_for(model)()
+
+        hedged = False
+        try:
+            if hedge_after is None:
+                return request_for(model)()
+
+            primary = self._hedge_executor.submit(request_for(model))
+            done, _ = wait([primary], timeout=hedge_after)
+            if done:
+                return primary.result()
+
+            logger.warning(f"'{model}' exceeded {hedge_after}s. Hedging with '{fallback_model}'.")
+            self._count(model, "hedged")
+            hedged = True
+            hedge = self._hedge_executor.submit(request_for(fallback_model))
+            pending = {primary, hedge}
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future.exception() is None:
+                        return future.result()
+            # Both failed; surface the primary model's error
+            return primary.result()
+        except Exception as e:
+            # Requests the API rejected as invalid would fail on the fallback too
+            if hedged or not (isinstance(e, LLMUnavailableError) or self._is_retryable(e)):
+                raise
+            logger.warning(f"'{model}' failed ({e}). Falling back to '{fallback_model}'.")
+            self._count(model, "fallbacks")
+            return request_for(fallback_model)()
+
+    def transcribe(self, file, model: str = "whisper-large-v3", **kwargs):
+        """Transcribes audio under the same limits and retry policy as chat calls."""
+        return self._call(model, lambda: self.client.audio.transcriptions.create(file=file, model=model, **kwargs), 0)
+
+    def metrics(self) -> Dict[str, Any]:
+        """Per-model request, error and latency statistics plus limiter and breaker state."""
+        with self._registry_lock:
+            models = list(self._stats)
+        report = {}
+        for model in models:
+            (request_bucket, token_bucket), breaker, stats = self._for_model(model)
+            report[model] = {
+                **stats.snapshot(),
+                "circuit": breaker.state,
+                "requests_available": round(request_bucket.tokens, 2),
+                "tokens_available": round(token_bucket.tokens, 2),
+            }
+        return report
+
+def _env_float(name: str) -> Optional[float]:
+    value = os.getenv(name)
+    return float(value) if value else None
+
+def _env_limits(name: str, default: str = "") -> Dict[str, tuple]:
+    """Parses 'model=rpm:tpm;other=rpm:tpm' pairs."""
+    limits = {}
+    for item in os.getenv(name, default).split(";"):
+        if "=" not in item: continue
+        model, values = (part.strip() for part in item.rsplit("=", 1))
+        rpm, tpm = values.split(":")
+        limits[model] = (int(rpm), int(tpm))
+    return limits
+
+def _env_fallbacks(name: str) -> Dict[str, str]:
+    """Parses 'primary=fallback;other=fallback' pairs."""
+    pairs = [item.split("=", 1) for item in os.getenv(name, "").split(";") if "=" in item]
+    return {primary.strip(): fallback.strip() for primary, fallback in pairs}
+
+@lru_cache(maxsize=None)
+def get_llm_gateway() -> LLMGateway:
+    """Returns the process-wide gateway, configured from GROQ_RPM, GROQ_TPM, GROQ_LIMITS, LLM_FALLBACK_MODELS, LLM_HEDGE_AFTER and LLM_MAX_QUEUE_WAIT."""
+    return LLMGateway(
+        rpm=int(os.getenv("GROQ_RPM", "30")),
+        tpm=int(os.getenv("GROQ_TPM", "6000")),
+        fallback_models=_env_fallbacks("LLM_FALLBACK_MODELS"),
+        hedge_after=_env_float("LLM_HEDGE_AFTER"),
+        max_queue_wait=_env_float("LLM_MAX_QUEUE_WAIT") or 20.0,
+        model_limits=_env_limits("GROQ_LIMITS", DEFAULT_MODEL_LIMITS),
+    )
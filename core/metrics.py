@@ -0,0 +1,149 @@
+import time
+import bisect
+import logging
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Per-request list of stage timings, only set when a caller asked for debug output.
+# asyncio.to_thread copies the context, so stages timed in worker threads land in the same list.
+_request_timings: ContextVar[Optional[List[Dict]]] = ContextVar("request_timings", default=None)
+
+class MetricsRegistry:
+    """A small in-process registry of counters, gauges and histograms rendered in Prometheus text format."""
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._help: Dict[str, Tuple[str, str]] = {}
+        self._counters: Dict[Tuple[str, tuple], float] = {}
+        self._gauges: Dict[Tuple[str, tuple], float] = {}
+        self._histograms: Dict[Tuple[str, tuple], list] = {}
+        self._gauge_callbacks: Dict[str, Callable[[], Dict[tuple, float]]] = {}
+        self._lock = threading.Lock()
+
+    def describe(self, name: str, metric_type: str, help_text: str):
+        self._help[name] = (metric_type, help_text)
+
+    def inc(self, name: str, amount: float = 1.0, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.0) + amount
+
+    def set_gauge(self, name: str, value: float, **labels):
+        with self._lock:
+            self._gauges[(name, tuple(sorted(labels.items())))] = value
+
+    def add_gauge(self, name: str, amount: float, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._gauges[key] = self._gauges.get(key, 0.0) + amount
+
+    def gauge_callback(self, name: str, callback: Callable[[], Dict[tuple, float]]):
+        """Registers a function that returns {label_tuple: value} when the metrics are scraped."""
+        self._gauge_callbacks[name] = callback
+
+    def observe(self, name: str, value: float, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            state = self._histograms.get(key)
+            if state is None:
+                # Per-bucket counts (the last slot is +Inf), sum, count
+                state = self._histograms[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][bisect.bisect_left(self.buckets, value)] += 1
+            state[1] += value
+            state[2] += 1
+
+    def record_cache(self, cache: str, hit: bool):
+        self.inc("cache_requests_total", cache=cache, result="hit" if hit else "miss")
+
+    @staticmethod
+    def _format_labels(labels: tuple, extra: tuple = ()) -> str:
+        items = list(labels) + list(extra)
+        if not items: return ""
+        escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in items)
+        return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(items, escaped)) + "}"
+
+    def render(self) -> str:
+        """Returns every metric in the Prometheus text exposition format."""
+        with self._lock:
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+            histograms = {key: (list(state[0]), state[1], state[2]) for key, state in self._histograms.items()}
+        for name, callback in self._gauge_callbacks.items():
+            try:
+                for labels, value in callback().items():
+                    gauges[(name, labels)] = value
+            except Exception as e:
+                logger.warning(f"Gauge callback for '{name}' failed: {e}")
+
+        lines, described = [], set()
+        def header(name: str, default_type: str):
+            if name in described: return
+            described.add(name)
+            metric_type, help_text = self._help.get(name, (default_type, name.replace("_", " ")))
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+
+        for (name, labels), value in sorted(counters.items()):
+            header(name, "counter")
+            lines.append(f"{name}{self._format_labels(labels)} {value}")
+        for (name, labels), value in sorted(gauges.items()):
+            header(name, "gauge")
+            lines.append(f"{name}{self._format_labels(labels)} {value}")
+        for (name, labels), (counts, total, count) in sorted(histograms.items()):
+            header(name, "histogram")
+            cumulative = 0
+            for bound, bucket_count in zip(list(self.buckets) + ["+Inf"], counts):
+                cumulative += bucket_count
+                lines.append(f"{name}_bucket{self._format_labels(labels, (('le', bound),))} {cumulative}")
+            lines.append(f"{name}_sum{self._format_labels(labels)} {total}")
+            lines.append(f"{name}_count{self._format_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+metrics = MetricsRegistry()
+metrics.describe("stage_duration_seconds", "histogram", "Time spent in each pipeline stage.")
+metrics.describe("cache_requests_total", "counter", "Cache lookups by cache and result (hit or miss).")
+metrics.describe("http_request_duration_seconds", "histogram", "HTTP request latency by route.")
+metrics.describe("http_requests_in_progress", "gauge", "HTTP requests currently being handled.")
+metrics.describe("llm_request_duration_seconds", "histogram", "Latency of individual LLM API calls by model.")
+metrics.describe("llm_requests_total", "counter", "LLM API calls by model and outcome (ok, HTTP status or error type).")
+metrics.describe("llm_requests_waiting", "gauge", "LLM calls blocked on the rate limiter.")
+metrics.describe("llm_requests_in_flight", "gauge", "LLM calls currently awaiting a response.")
+metrics.describe("speculative_web_searches_total", "counter", "Web searches started alongside the RAG lookup, by whether they were used or cancelled.")
+metrics.describe("web_fetch_pages_total", "counter", "Page fetches by outcome (complete, enough_text, byte_cap, not_html, http_error).")
+metrics.describe("web_fetch_bytes_total", "counter", "Response bytes read while fetching web pages.")
+metrics.describe("kb_documents", "gauge", "Documents in the text knowledge base.")
+metrics.describe("kb_evictions_total", "counter", "Knowledge-base documents evicted, by reason (ttl or max_size).")
+metrics.describe("kb_refreshes_total", "counter", "Stale knowledge-base documents re-fetched, by outcome.")
+metrics.describe("kb_compactions_total", "counter", "Knowledge-base index rebuilds.")
+metrics.describe("admission_in_flight", "gauge", "Requests holding an admission slot, by endpoint (_global is the shared pool).")
+metrics.describe("admission_queued", "gauge", "Requests waiting for an admission slot, by endpoint.")
+metrics.describe("admission_limit", "gauge", "Configured concurrency limit, by endpoint.")
+metrics.describe("admission_rejected_total", "counter", "Requests shed by admission control, by endpoint and reason.")
+metrics.describe("admission_wait_seconds", "histogram", "Time admitted requests spent queued for a slot.")
+
+def start_request_timings() -> List[Dict]:
+    """Starts collecting stage timings for the current request and returns the list they are added to."""
+    timings: List[Dict] = []
+    _request_timings.set(timings)
+    return timings
+
+@contextmanager
+def stage(name: str, **labels):
+    """Times a block, records it in the stage histogram and, in debug mode, in the request's timings."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - start, **labels)
+
+def record_stage(name: str, elapsed: float, **labels):
+    """Records a stage timed by the caller, e.g. work interleaved with another stage."""
+    metrics.observe("stage_duration_seconds", elapsed, stage=name, **labels)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.append({"stage": name, **labels, "ms": round(elapsed * 1000, 2)})
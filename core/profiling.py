@@ -0,0 +1,170 @@
+import os
+import re
+import sys
+import time
+import hmac
+import json
+import logging
+import threading
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+def _thread_cpu_time(ident: int) -> Optional[float]:
+    """CPU seconds used by a thread, or None where per-thread CPU clocks are unavailable (e.g. Windows)."""
+    try:
+        return time.clock_gettime(time.pthread_getcpuclockid(ident))
+    except (AttributeError, OSError, OverflowError):
+        return None
+
+class SamplingProfiler:
+    """
+    Samples the stacks of every thread in the process at a fixed interval. This covers the
+    event loop thread (and whichever coroutine is running on it) as well as executor threads.
+
+    Two profiles are collected in folded-stack format (`frame;frame;frame count`):
+    wall-clock, which counts every sample, and CPU, which only counts samples where the
+    thread's CPU clock advanced since the previous sample.
+    """
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.wall: Counter = Counter()
+        self.cpu: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+        self._started_at = 0.0
+        self.duration = 0.0
+
+    @staticmethod
+    def _fold(frame) -> str:
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})")
+            frame = frame.f_back
+        return ";".join(reversed(stack))
+
+    def _run(self):
+        own_ident = threading.get_ident()
+        last_cpu: Dict[int, float] = {}
+        thread_names: Dict[int, str] = {}
+        while not self._stop.wait(self.interval):
+            if self.samples % 50 == 0:
+                thread_names = {t.ident: t.name for t in threading.enumerate()}
+            self.samples += 1
+            for ident, frame in sys._current_frames().items():
+                if ident == own_ident: continue
+                key = f"{thread_names.get(ident, ident)};{self._fold(frame)}"
+                self.wall[key] += 1
+                cpu_now = _thread_cpu_time(ident)
+                if cpu_now is not None:
+                    if ident in last_cpu and cpu_now > last_cpu[ident]:
+                        self.cpu[key] += 1
+                    last_cpu[ident] = cpu_now
+
+    def start(self) -> "SamplingProfiler":
+        self._started_at = time.perf_counter()
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.duration = time.perf_counter() - self._started_at
+
+class ProfileManager:
+    """
+    Decides which requests to profile and stores the results under `profiles_dir`.
+
+    A request is profiled when it sends `X-Profile: 1` or `?profile=1`, or when it is
+    picked by 1-in-N sampling. Explicit requests must also send `admin_token` in
+    `X-Admin-Token`, since profiles expose stacks and file paths. Only one request is profiled
+    at a time; the sampler sees every thread, so concurrent requests show up in the profile too.
+    """
+    def __init__(self, admin_token: str, profiles_dir: str = "data/profiles", sample_every: int = 0,
+                 interval: float = 0.005, keep: int = 200):
+        if not admin_token:
+            raise ValueError("Profiling needs an admin token.")
+        self.profiles_dir = Path(profiles_dir)
+        self.profiles_dir.mkdir(parents=True, exist_ok=True)
+        self.sample_every = sample_every
+        self.interval = interval
+        self.admin_token = admin_token
+        self.keep = keep
+        self._counter = 0
+        self._busy = threading.Lock()
+
+    def is_admin(self, token: Optional[str]) -> bool:
+        return bool(token) and hmac.compare_digest(token.encode("utf-8"), self.admin_token.encode("utf-8"))
+
+    def wants_profile(self, headers, query_params) -> bool:
+        explicit = headers.get("x-profile") == "1" or query_params.get("profile") == "1"
+        if explicit:
+            return self.is_admin(headers.get("x-admin-token"))
+        if self.sample_every > 0:
+            self._counter += 1
+            return self._counter % self.sample_every == 0
+        return False
+
+    def begin(self) -> Optional[SamplingProfiler]:
+        """Starts a profiler, or returns None if another request is already being profiled."""
+        if not self._busy.acquire(blocking=False):
+            return None
+        return SamplingProfiler(self.interval).start()
+
+    def finish(self, profiler: SamplingProfiler, method: str, path: str, status: int) -> str:
+        """Stops the profiler, writes the folded profiles and metadata, and returns the profile id."""
+        try:
+            profiler.stop()
+            slug = re.sub(r'[^\w\-]', '_', path.strip("/"))[:60] or "root"
+            profile_id = f"{time.strftime('%Y%m%d_%H%M%S')}_{int(time.time() * 1000) % 1000:03d}_{method}_{slug}"
+            for kind, counts in (("wall", profiler.wall), ("cpu", profiler.cpu)):
+                lines = (f"{stack} {count}" for stack, count in counts.most_common())
+                (self.profiles_dir / f"{profile_id}.{kind}.folded").write_text("\n".join(lines) + "\n", encoding="utf-8")
+            meta = {"id": profile_id, "method": method, "path": path, "status": status,
+                    "duration_ms": round(profiler.duration * 1000, 1), "samples": profiler.samples,
+                    "interval_ms": self.interval * 1000}
+            (self.profiles_dir / f"{profile_id}.json").write_text(json.dumps(meta, indent=2), encoding="utf-8")
+            self._prune()
+            logger.info(f"Saved request profile {profile_id} ({meta['duration_ms']} ms, {profiler.samples} samples)")
+            return profile_id
+        finally:
+            self._busy.release()
+
+    def _prune(self):
+        metas = sorted(self.profiles_dir.glob("*.json"))
+        for meta in metas[:-self.keep] if len(metas) > self.keep else []:
+            for path in self.profiles_dir.glob(f"{meta.stem}.*"):
+                path.unlink(missing_ok=True)
+
+    def list_profiles(self) -> List[Dict]:
+        profiles = []
+        for meta in sorted(self.profiles_dir.glob("*.json"), reverse=True):
+            try:
+                profiles.append(json.loads(meta.read_text(encoding="utf-8")))
+            except (OSError, ValueError):
+                continue
+        return profiles
+
+    def profile_path(self, profile_id: str, kind: str) -> Optional[Path]:
+        if kind not in ("wall", "cpu") or not re.fullmatch(r'[\w\-]+', profile_id):
+            return None
+        path = self.profiles_dir / f"{profile_id}.{kind}.folded"
+        return path if path.exists() else None
+
+def profile_manager_from_env() -> Optional[ProfileManager]:
+    """Builds a manager when PROFILING_ENABLED=1 and ADMIN_TOKEN is set; otherwise profiling is never installed."""
+    if os.getenv("PROFILING_ENABLED", "0") != "1":
+        return None
+    admin_token = os.getenv("ADMIN_TOKEN")
+    if not admin_token:
+        logger.warning("PROFILING_ENABLED=1 but ADMIN_TOKEN is not set. Profiling stays off.")
+        return None
+    return ProfileManager(
+        admin_token=admin_token,
+        sample_every=int(os.getenv("PROFILE_SAMPLE_EVERY", "0")),
+        interval=float(os.getenv("PROFILE_INTERVAL_MS", "5")) / 1000,
+    )
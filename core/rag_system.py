@@ -1,54 +1,124 @@
+import io
+import time
 import chromadb
+import hashlib
 import logging
+import threading
+from collections import OrderedDict
+from functools import lru_cache
 from sentence_transformers import SentenceTransformer
 from typing import List, Dict, Any
 from PIL import Image
 from pathlib import Path
+from core.metrics import metrics, stage
+from core.embedding_backends import load_with_backend, backend_from_env
 
 logger = logging.getLogger(__name__)
 
+TEXT_EMBEDDING_MODEL = 'sentence-transformers/all-MiniLM-L6-v2'
+IMAGE_EMBEDDING_MODEL = 'clip-ViT-B-32'
+
+@lru_cache(maxsize=None)
+def load_embedding_model(model_name: str) -> SentenceTransformer:
+    """
+    Loads an embedding model once per process so every RAG system and indexer shares it.
+    The inference backend (torch, onnx or onnx-int8) and thread count come from the environment.
+    """
+    config = backend_from_env()
+    logger.info(f"Loading embedding model '{model_name}' with the {config['backend']} backend...")
+    return load_with_backend(model_name, **config)
+
 class TextRAGSystem:
-    """A RAG system specialized for text documents."""
-    def __init__(self, db_path: str = "data/chroma_db_text"):
+    """
+    A RAG system specialized for text documents. Every document carries `added_at`,
+    `last_hit_at` and `source_type` metadata so core.kb_lifecycle can expire, refresh and
+    compact the collection; `lock` serializes writes with the collection swap done by compaction.
+    """
+    def __init__(self, db_path: str = "data/chroma_db_text", collection_name: str = "text_documents"):
         # This model is optimized for understanding text sentences.
-        self.embedding_model = SentenceTransformer('sentence-transformers/all-MiniLM-L6-v2', device="cpu")
+        self.embedding_model = load_embedding_model(TEXT_EMBEDDING_MODEL)
+        self.db_path = db_path
         self.client = chromadb.PersistentClient(path=db_path)
-        self.collection = self.client.get_or_create_collection(name="text_documents")
+        self.collection_name = collection_name
+        self.collection = self.client.get_or_create_collection(name=collection_name)
+        self.lock = threading.Lock()
+        # Hit times are buffered here and written back to `last_hit_at` in batches by flush_hits()
+        self._pending_hits: Dict[str, float] = {}
+        self._hits_lock = threading.Lock()
         logger.info(f"Text RAG System initialized. Documents: {self.collection.count()}")
 
     def add_documents(self, docs_to_add: List[Dict[str, Any]]):
         if not docs_to_add: return
+        now = time.time()
         texts = [doc['text'] for doc in docs_to_add]
-        metadatas = [doc['metadata'] for doc in docs_to_add]
+        metadatas = [{"added_at": now, "last_hit_at": now, "source_type": "web", **doc['metadata']} for doc in docs_to_add]
         ids = [meta.get('source', str(hash(text))) for meta, text in zip(metadatas, texts)]
-        embeddings = self.embedding_model.encode(texts, convert_to_tensor=False).tolist()
-        self.collection.add(embeddings=embeddings, documents=texts, metadatas=metadatas, ids=ids)
+        with stage("embed_documents"):
+            embeddings = self.embedding_model.encode(texts, convert_to_tensor=False).tolist()
+        # Upsert so a refreshed page replaces its stale copy under the same id
+        with self.lock:
+            self.collection.upsert(embeddings=embeddings, documents=texts, metadatas=metadatas, ids=ids)
         logger.info(f"Added {len(docs_to_add)} documents to Text RAG. Total: {self.collection.count()}")
 
+    def record_hit(self, result: Dict[str, Any]):
+        """Marks a search result as used; the timestamp reaches the collection on the next flush_hits()."""
+        if 'id' in result:
+            with self._hits_lock:
+                self._pending_hits[result['id']] = time.time()
+
+    def flush_hits(self) -> int:
+        """Writes buffered hits to the documents' `last_hit_at` metadata and returns how many were written."""
+        with self._hits_lock:
+            pending, self._pending_hits = self._pending_hits, {}
+        if not pending: return 0
+        ids = list(pending)
+        # Chroma merges updated metadata keys, so only last_hit_at is sent; anything else could
+        # overwrite a refresh that happened after the hit
+        metadatas = [{"last_hit_at": hit_at} for hit_at in pending.values()]
+        with self.lock:
+            self.collection.update(ids=ids, metadatas=metadatas)
+        return len(ids)
+
     def search(self, query: str, k: int = 3) -> List[Dict[str, Any]]:
-        if self.collection.count() == 0: return []
-        query_embedding = self.embedding_model.encode([query]).tolist()
-        results = self.collection.query(query_embeddings=query_embedding, n_results=k)
+        return self.search_many([query], k)[0]
+
+    def search_many(self, queries: List[str], k: int = 3) -> List[List[Dict[str, Any]]]:
+        """Searches for several queries with one batched embedding call and one vector query."""
+        if not queries: return []
+        if self.collection.count() == 0: return [[] for _ in queries]
+        with stage("embed_query"):
+            query_embeddings = self.embedding_model.encode(queries, batch_size=64).tolist()
+        with stage("vector_query"):
+            results = self.collection.query(query_embeddings=query_embeddings, n_results=k)
         
-        formatted_results = []
-        for i in range(len(results['ids'][0])):
-            distance = results['distances'][0][i]
-            score = 1 - distance
-            if score > 0.6:
-                formatted_results.append({
-                    "text": results['documents'][0][i],
-                    "metadata": results['metadatas'][0][i],
-                    "score": score
-                })
-        return sorted(formatted_results, key=lambda x: x['score'], reverse=True)
+        all_results = []
+        for q in range(len(queries)):
+            formatted_results = []
+            for i in range(len(results['ids'][q])):
+                distance = results['distances'][q][i]
+                score = 1 - distance
+                if score > 0.6:
+                    formatted_results.append({
+                        "id": results['ids'][q][i],
+                        "text": results['documents'][q][i],
+                        "metadata": results['metadatas'][q][i],
+                        "score": score
+                    })
+            all_results.append(sorted(formatted_results, key=lambda x: x['score'], reverse=True))
+        return all_results
 
 class ImageRAGSystem:
-    """A RAG system specialized for searching images with text."""
-    def __init__(self, db_path: str = "data/chroma_db_image"):
+    """A RAG system specialized for searching images with text or with another image."""
+    def __init__(self, db_path: str = "data/chroma_db_image", query_cache_size: int = 256):
         # This CLIP model understands both images and text.
-        self.embedding_model = SentenceTransformer('clip-ViT-B-32', device="cpu")
+        self.embedding_model = load_embedding_model(IMAGE_EMBEDDING_MODEL)
         self.client = chromadb.PersistentClient(path=db_path)
-        self.collection = self.client.get_or_create_collection(name="image_documents")
+        self.collection = self.client.get_or_create_collection(name="image_documents", metadata={"hnsw:space": "cosine"})
+        # Query-image embeddings keyed by the SHA-256 of the uploaded bytes
+        self._query_cache: "OrderedDict[str, List[float]]" = OrderedDict()
+        # Searches embed from to_thread workers, so every cache access holds this lock
+        self._query_cache_lock = threading.Lock()
+        self.query_cache_size = query_cache_size
         logger.info(f"Image RAG System initialized. Images: {self.collection.count()}")
 
     def add_images_from_folder(self, folder_path: str):
@@ -61,23 +131,78 @@ class ImageRAGSystem:
         images = [Image.open(filepath) for filepath in image_paths]
         filepath_strs = [str(filepath) for filepath in image_paths]
         
-        image_embeddings = self.embedding_model.encode(images, convert_to_tensor=False).tolist()
+        image_embeddings = self.embedding_model.encode(images, convert_to_tensor=False, normalize_embeddings=True).tolist()
 
-        self.collection.add(
+        self.collection.upsert(
             embeddings=image_embeddings,
             metadatas=[{"filepath": fp} for fp in filepath_strs],
             ids=filepath_strs
         )
         logger.info(f"Added {len(image_paths)} images to Image RAG. Total: {self.collection.count()}")
 
-    def search_images_by_text(self, text_query: str, k: int = 3) -> List[Dict[str, Any]]:
+    def embed_image_bytes(self, image_bytes: bytes) -> List[float]:
+        """Embeds an uploaded image, reusing the cached embedding when the same bytes were seen before."""
+        digest = hashlib.sha256(image_bytes).hexdigest()
+        with self._query_cache_lock:
+            cached = self._query_cache.get(digest)
+            if cached is not None:
+                self._query_cache.move_to_end(digest)
+        if cached is not None:
+            metrics.record_cache("image_query_embedding", hit=True)
+            return cached
+        metrics.record_cache("image_query_embedding", hit=False)
+
+        with stage("embed_image"):
+            image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
+            embedding = self.embedding_model.encode([image], convert_to_tensor=False, normalize_embeddings=True)[0].tolist()
+
+        with self._query_cache_lock:
+            self._query_cache[digest] = embedding
+            if len(self._query_cache) > self.query_cache_size:
+                self._query_cache.popitem(last=False)
+        return embedding
+
+    def _distance_to_score(self, distance: float) -> float:
+        """Converts a Chroma distance into a cosine similarity for normalized embeddings."""
+        space = (self.collection.metadata or {}).get("hnsw:space", "l2")
+        if space == "cosine":
+            return 1 - distance
+        # Squared L2 between unit vectors is 2 - 2*cos
+        return 1 - distance / 2
+
+    def _query(self, embedding: List[float], k: int, min_score: float, offset: int) -> List[Dict[str, Any]]:
+        """Runs a nearest-neighbour query and returns one page of results above the score threshold."""
+        total = self.collection.count()
+        if total == 0 or offset >= total: return []
+
+        with stage("vector_query", collection="images"):
+            results = self.collection.query(query_embeddings=[embedding], n_results=min(offset + k, total))
+
+        # Results come back sorted by similarity, so filtering keeps the order stable across pages
+        matches = []
+        for metadata, distance in zip(results['metadatas'][0], results['distances'][0]):
+            score = self._distance_to_score(distance)
+            if score >= min_score:
+                matches.append({**metadata, "score": score})
+        return matches[offset:offset + k]
+
+    def search_images_by_text(self, text_query: str, k: int = 3, min_score: float = 0.0, offset: int = 0) -> List[Dict[str, Any]]:
         """Searches for images using a text query."""
-        if self.collection.count() == 0: return []
-        
         # The same model encodes the text query
-        query_embedding = self.embedding_model.encode([text_query]).tolist()
-        
-        results = self.collection.query(query_embeddings=query_embedding, n_results=k)
-        
-        # Returns the metadata of the most similar images
-        return results.get('metadatas', [[]])[0]
\ No newline at end of file
+        query_embedding = self.embedding_model.encode([text_query], normalize_embeddings=True)[0].tolist()
+        return self._query(query_embedding, k, min_score, offset)
+
+    def search_images_by_image(self, image_bytes: bytes, k: int = 3, min_score: float = 0.0, offset: int = 0) -> List[Dict[str, Any]]:
+        """Searches for visually similar images using an example image."""
+        query_embedding = self.embed_image_bytes(image_bytes)
+        return self._query(query_embedding, k, min_score, offset)
+_image_rag = None
+_image_rag_lock = threading.Lock()
+
+def get_image_rag_system() -> ImageRAGSystem:
+    """Returns the process-wide image RAG system, loading CLIP on the first image search rather than at startup."""
+    global _image_rag
+    with _image_rag_lock:
+        if _image_rag is None:
+            _image_rag = ImageRAGSystem()
+        return _image_rag
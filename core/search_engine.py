@@ -1,50 +1,145 @@
+import os
 import time
 import logging
 import asyncio
+import aiohttp
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Dict, List, Optional
 
 from core.rag_system import TextRAGSystem
 from core.web_fetcher import WebFetcher
 from core.summarizer import GeminiSummarizer
+from core.context_selector import ContextSelector
+from core.metrics import metrics, stage
 from services.audio_processor import AudioProcessor
 
 logger = logging.getLogger(__name__)
 
+# "rag_first" starts the web search alongside the RAG lookup and cancels it on a confident hit.
+# "sequential" only searches the web after a RAG miss, which spends less provider quota.
+EARLY_ANSWER_POLICIES = ("rag_first", "sequential")
+
 class SearchEngine:
-    def __init__(self):
+    def __init__(self, rag_threshold: float = 0.65, video_grace: float = 0.5, early_answer: Optional[str] = None):
         self.rag_system = TextRAGSystem()
         self.web_fetcher = WebFetcher()
         self.summarizer = GeminiSummarizer()
+        self.context_selector = ContextSelector(self.rag_system.embedding_model)
         self.audio_processor = AudioProcessor(self.summarizer)
+        self.rag_threshold = rag_threshold
+        # Once the answer is ready, the video suggestion gets this much longer before it is dropped
+        self.video_grace = video_grace
+        # yt-dlp lookups that hang keep their thread, so they get a small pool of their own
+        # instead of tying up the default executor used for RAG, summaries and extraction
+        self._video_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="video-search")
+        self.early_answer = early_answer or os.getenv("SEARCH_EARLY_ANSWER", "rag_first")
+        if self.early_answer not in EARLY_ANSWER_POLICIES:
+            raise ValueError(f"Unknown early-answer policy '{self.early_answer}'. Use one of {EARLY_ANSWER_POLICIES}.")
+
+    async def _rag_lookup(self, query: str) -> List[Dict]:
+        with stage("rag_lookup"):
+            return await asyncio.to_thread(self.rag_system.search, query, 1)
+
+    async def _web_lookup(self, query: str, links: Optional[List[Dict]],
+                          session: Optional[aiohttp.ClientSession] = None) -> Optional[Dict]:
+        with stage("web_search"):
+            return await self.web_fetcher.fetch_and_parse_best_result(query, links=links, session=session)
+
+    async def _video_lookup(self, query: str) -> Optional[Dict]:
+        with stage("video_search"):
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._video_executor, self.audio_processor.search_for_video, query)
+
+    async def _video_after_answer(self, video_task: asyncio.Task, query: str) -> Optional[Dict]:
+        """Waits at most `video_grace` seconds more for a video lookup that started with the search."""
+        try:
+            return await asyncio.wait_for(video_task, self.video_grace)
+        except asyncio.TimeoutError:
+            logger.warning(f"Video search for '{query}' was still running {self.video_grace}s after the answer; answering without a suggestion.")
+            return None
 
-    async def _get_web_content_and_summary(self, query: str, age_group: str) -> dict:
-        """Gets content from RAG or Web and generates a summary."""
-        rag_results = self.rag_system.search(query, k=1)
+    async def _get_web_content_and_summary(self, query: str, age_group: str, links: Optional[List[Dict]] = None,
+                                           rag_results: Optional[List[Dict]] = None,
+                                           session: Optional[aiohttp.ClientSession] = None) -> dict:
+        """
+        Gets content from RAG or Web and generates a summary.
+        `rag_results` skips the lookup when the caller already ran it (e.g. as part of a batch).
+        """
         context, metadata, source_type, confidence = "", {}, "No Results", 0.0
 
-        if rag_results and rag_results[0]['score'] > 0.65:
-            context = rag_results[0]['text']
-            metadata = rag_results[0]['metadata']
-            source_type, confidence = "Knowledge Base (RAG)", rag_results[0]['score']
-        else:
-            web_result = await self.web_fetcher.fetch_and_parse_best_result(query)
-            if web_result:
-                context = web_result['text']
-                metadata = web_result['metadata']
-                source_type, confidence = "Web Learned", 0.5
-                self.rag_system.add_documents([web_result])
+        # Speculatively start the web search so a RAG miss does not pay for it serially
+        speculate = rag_results is None and self.early_answer == "rag_first"
+        web_task = asyncio.create_task(self._web_lookup(query, links, session)) if speculate else None
+        if web_task:
+            # Retrieve the outcome even when the task is discarded, so failures are not reported as unhandled
+            web_task.add_done_callback(lambda task: task.cancelled() or task.exception())
+        try:
+            if rag_results is None:
+                rag_results = await self._rag_lookup(query)
+            if rag_results and rag_results[0]['score'] > self.rag_threshold:
+                if web_task:
+                    web_task.cancel()
+                    metrics.inc("speculative_web_searches_total", outcome="cancelled")
+                context = rag_results[0]['text']
+                metadata = rag_results[0]['metadata']
+                source_type, confidence = "Knowledge Base (RAG)", rag_results[0]['score']
+                self.rag_system.record_hit(rag_results[0])
+            else:
+                if web_task:
+                    metrics.inc("speculative_web_searches_total", outcome="used")
+                web_result = await (web_task or self._web_lookup(query, links, session))
+                if web_result:
+                    context = web_result['text']
+                    metadata = web_result['metadata']
+                    source_type, confidence = "Web Learned", 0.5
+                    with stage("rag_insert"):
+                        await asyncio.to_thread(self.rag_system.add_documents, [web_result])
+        finally:
+            if web_task and not web_task.done():
+                web_task.cancel()
         
-        summary = self.summarizer.generate_summary(context, query, age_group) if context else "Sorry, I could not find information on that topic."
+        if context:
+            # Drop boilerplate sentences unrelated to the query to keep the prompt small
+            with stage("context_selection"):
+                context = await asyncio.to_thread(self.context_selector.select, context, query)
+            # The LLM call blocks, so it runs off the event loop to let concurrent searches overlap
+            with stage("summarize"):
+                summary = await asyncio.to_thread(self.summarizer.generate_summary, context, query, age_group)
+        else:
+            summary = "Sorry, I could not find information on that topic."
         return {"summary": summary, "metadata": metadata, "source_type": source_type, "confidence": confidence}
 
-    async def search(self, query: str, age_group: str) -> dict:
-        """Orchestrates a multi-source search and suggests a video."""
+    @staticmethod
+    def _build_result(query: str, age_group: str, web_result: dict, video_suggestion: Optional[dict], start_time: float) -> dict:
+        return {
+            "query": query,
+            "age_group": age_group,
+            "summary": web_result["summary"],
+            "source": web_result["metadata"].get('source', 'N/A'),
+            "title": web_result["metadata"].get('title', query),
+            "type": web_result["source_type"],
+            "confidence": web_result["confidence"],
+            "youtube_suggestion": video_suggestion, # This adds the video info to the response
+            "processing_time": time.time() - start_time
+        }
+
+    async def search(self, query: str, age_group: str, links: Optional[List[Dict]] = None, suggest_video: bool = True) -> dict:
+        """
+        Orchestrates a multi-source search and suggests a video.
+        `links` reuses an earlier web search; `suggest_video=False` skips the YouTube lookup (e.g. for evaluation).
+        """
         start_time = time.time()
         
-        # Quickly search for a video suggestion first
-        video_suggestion = self.audio_processor.search_for_video(query)
+        # The video suggestion runs alongside the answer and is collected once the answer is ready
+        video_task = asyncio.create_task(self._video_lookup(query)) if suggest_video else None
         
         # Run the main web search
-        web_result = await self._get_web_content_and_summary(query, age_group)
+        try:
+            web_result = await self._get_web_content_and_summary(query, age_group, links=links)
+        except BaseException:
+            if video_task: video_task.cancel()
+            raise
+        video_suggestion = await self._video_after_answer(video_task, query) if video_task else None
         
         # If a video was found, start its slow audio processing in the background
         if video_suggestion:
@@ -56,16 +151,45 @@ class SearchEngine:
             )
 
         # Combine results for the final response
-        final_result = {
-            "query": query,
-            "age_group": age_group,
-            "summary": web_result["summary"],
-            "source": web_result["metadata"].get('source', 'N/A'),
-            "title": web_result["metadata"].get('title', query),
-            "type": web_result["source_type"],
-            "confidence": web_result["confidence"],
-            "youtube_suggestion": video_suggestion, # This adds the video info to the response
-            "processing_time": time.time() - start_time
-        }
-        
-        return final_result
\ No newline at end of file
+        return self._build_result(query, age_group, web_result, video_suggestion, start_time)
+
+    async def search_many(self, queries: List[str], age_group: str, concurrency: int = 8) -> AsyncIterator[dict]:
+        """
+        Answers a batch of queries and yields each result as soon as it is ready.
+        Identical queries are answered once. All RAG lookups share one batched embedding call
+        and vector query, and web fetches for the misses share one connection pool, with at
+        most `concurrency` queries being fetched and summarized at a time. Results carry the
+        `index` of the query in the input list; a duplicate query yields one result per index.
+        No video suggestions are made for batches.
+        """
+        positions: Dict[str, List[int]] = {}
+        for index, query in enumerate(queries):
+            positions.setdefault(query, []).append(index)
+        unique_queries = list(positions)
+
+        with stage("rag_lookup", batch="true"):
+            all_rag_results = await asyncio.to_thread(self.rag_system.search_many, unique_queries, 1)
+
+        semaphore = asyncio.Semaphore(concurrency)
+        async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=concurrency * 2)) as session:
+            async def answer(query: str, rag_results: List[Dict]) -> tuple:
+                async with semaphore:
+                    start_time = time.time()
+                    try:
+                        web_result = await self._get_web_content_and_summary(
+                            query, age_group, rag_results=rag_results, session=session)
+                    except Exception as e:
+                        logger.error(f"Batch search failed for '{query}': {e}")
+                        return query, {"query": query, "age_group": age_group, "error": f"{type(e).__name__}: {e}"}
+                    return query, self._build_result(query, age_group, web_result, None, start_time)
+
+            tasks = [asyncio.create_task(answer(q, r)) for q, r in zip(unique_queries, all_rag_results)]
+            try:
+                for next_done in asyncio.as_completed(tasks):
+                    query, result = await next_done
+                    for index in positions[query]:
+                        yield {"index": index, **result}
+            finally:
+                # The consumer may stop early (e.g. a client disconnect); don't leave work running
+                for task in tasks:
+                    task.cancel()
@@ -1,23 +1,34 @@
-﻿import os
-from groq import Groq
+﻿import re
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+from core.utils import estimate_tokens
+from core.llm_gateway import get_llm_gateway, LLMUnavailableError
+from core.metrics import metrics, stage
 import logging
 
 logger = logging.getLogger(__name__)
 
 class GeminiSummarizer: # Keeping the class name for consistency
-    def __init__(self):
-        try:
-            # Initialize the Groq client
-            api_key = os.getenv("GROQ_API_KEY")
-            if not api_key:
-                raise ValueError("GROQ_API_KEY not found in environment variables.")
-            self.client = Groq(api_key=api_key)
-            # Use the current, stable Llama 3.1 model on Groq
-            self.model_name = "llama-3.1-8b-instant" 
+    def __init__(self, chunk_tokens: int = 2500, max_concurrency: int = 4, chunk_cache_size: int = 1024, max_levels: int = 3):
+        # Long contexts are split into chunks of roughly this many tokens and summarized in parallel
+        self.chunk_tokens = chunk_tokens
+        self.max_concurrency = max_concurrency
+        # Each map-reduce level costs a round of LLM calls, so the depth is bounded
+        self.max_levels = max_levels
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="summarizer")
+        self._chunk_cache = {}
+        self._chunk_cache_size = chunk_cache_size
+        self._cache_lock = threading.Lock()
+        # All Groq traffic goes through the shared gateway for rate limiting, retries and fallbacks
+        self.gateway = get_llm_gateway()
+        # Use the current, stable Llama 3.1 model on Groq
+        self.model_name = "llama-3.1-8b-instant"
+        if self.gateway.available:
             logger.info("Groq (Llama 3.1) Summarizer initialized successfully.")
-        except Exception as e:
-            self.client = None
-            logger.error(f"Failed to initialize Groq Summarizer: {e}")
+        else:
+            logger.error("Failed to initialize Groq Summarizer: the LLM gateway is unavailable.")
 
     def _get_system_prompt(self, age_group: str, query: str) -> str:
         """Creates the instruction part of the prompt for the AI model."""
@@ -29,39 +40,144 @@ class GeminiSummarizer: # Keeping the class name for consistency
         }
         return prompts.get(age_group, prompts["adult"])
 
+    def _split_into_chunks(self, text: str, max_tokens: int) -> List[str]:
+        """Packs paragraphs (or sentences, for long paragraphs) into chunks that fit the token budget."""
+        max_chars = max_tokens * 4
+        pieces = []
+        for paragraph in re.split(r'\n\s*\n', text):
+            paragraph = paragraph.strip()
+            if not paragraph: continue
+            if len(paragraph) <= max_chars:
+                pieces.append(paragraph)
+                continue
+            for sentence in re.split(r'(?<=[.!?])\s+', paragraph):
+                # Hard-split anything that still has no usable boundary
+                pieces.extend(sentence[i:i + max_chars] for i in range(0, len(sentence), max_chars))
+
+        chunks, current = [], ""
+        for piece in pieces:
+            if current and len(current) + len(piece) + 2 > max_chars:
+                chunks.append(current)
+                current = piece
+            else:
+                current = f"{current}\n\n{piece}" if current else piece
+        if current: chunks.append(current)
+        return chunks
+
+    def _complete(self, system_instruction: str, content: str) -> str:
+        """Sends one system/user exchange to the model and returns the stripped reply."""
+        # The 'system' message gives the AI its instructions.
+        # The 'user' message provides the text to work on.
+        chat_completion = self.gateway.chat(
+            messages=[
+                {
+                    "role": "system",
+                    "content": system_instruction,
+                },
+                {
+                    "role": "user",
+                    "content": content,
+                }
+            ],
+            model=self.model_name,
+        )
+        return chat_completion.choices[0].message.content.strip()
+
+    def _summarize_chunk(self, chunk: str, query: str) -> str:
+        """Condenses one chunk into notes for the reduce step, caching the result by content hash."""
+        key = hashlib.sha256(f"{self.model_name}\0{query}\0{chunk}".encode('utf-8')).hexdigest()
+        with self._cache_lock:
+            if key in self._chunk_cache:
+                metrics.record_cache("chunk_summary", hit=True)
+                return self._chunk_cache[key]
+        metrics.record_cache("chunk_summary", hit=False)
+
+        instruction = (
+            f"You are condensing one section of a longer text about '{query}'. "
+            "Write in English. Keep every fact, name, number, argument and conclusion in this section; drop only repetition and filler."
+        )
+        partial = self._complete(instruction, chunk)
+
+        with self._cache_lock:
+            if len(self._chunk_cache) >= self._chunk_cache_size:
+                self._chunk_cache.pop(next(iter(self._chunk_cache)))
+            self._chunk_cache[key] = partial
+        return partial
+
+    def max_map_chunks(self) -> int:
+        """How many chunks one summary can map before its calls would be shed by the model's rate limit."""
+        # A full token bucket is spent without waiting; refills are left for concurrent requests
+        tpm = self.gateway.limits_for(self.model_name)[1]
+        per_call = self.chunk_tokens + self.gateway.expected_completion_tokens
+        # One call is kept back for the final summary
+        return max(1, tpm // per_call - 1)
+
+    @property
+    def max_input_chars(self) -> int:
+        """The longest input whose every part reaches the model; anything beyond it is dropped."""
+        return self.max_map_chunks() * self.chunk_tokens * 4
+
+    def _try_summarize_chunk(self, chunk: str, query: str) -> Optional[str]:
+        """Like `_summarize_chunk`, but returns None if the call was shed."""
+        try:
+            return self._summarize_chunk(chunk, query)
+        except LLMUnavailableError as e:
+            logger.warning(f"Leaving a chunk unsummarized: {e}")
+            return None
+
+    def _reduce_to_budget(self, context: str, query: str) -> str:
+        """
+        Map-reduce: summarizes chunks concurrently, repeating on the combined notes until they fit one call.
+        The first level only maps as many chunks as the model's token budget allows. Stops after
+        `max_levels` levels, as soon as a level fails to shrink the text, or once a call is shed,
+        and then truncates whatever is left to the budget.
+        """
+        level, tokens = 0, estimate_tokens(context)
+        max_chunks = self.max_map_chunks()
+        # With room for a single chunk, mapping it costs a call and gains nothing over truncating
+        while tokens > self.chunk_tokens and level < self.max_levels and max_chunks > 1:
+            chunks = self._split_into_chunks(context, self.chunk_tokens)
+            if len(chunks) > max_chunks:
+                logger.warning(f"Only {max_chunks} of {len(chunks)} chunks fit the '{self.model_name}' token budget; dropping the rest.")
+                chunks = chunks[:max_chunks]
+            level += 1
+            logger.info(f"Map-reduce level {level}: summarizing {len(chunks)} chunks with up to {self.max_concurrency} in parallel.")
+            with stage("llm_map", level=str(level)):
+                results = list(self._executor.map(lambda chunk: self._try_summarize_chunk(chunk, query), chunks))
+            # A shed chunk keeps its own text, which is truncated below if it does not fit
+            shed = results.count(None)
+            partials = [chunk if result is None else result for result, chunk in zip(results, chunks)]
+            reduced = "\n\n".join(partials)
+            reduced_tokens = estimate_tokens(reduced)
+            if reduced_tokens >= tokens:
+                logger.warning(f"Map-reduce level {level} did not shrink the text ({tokens} -> {reduced_tokens} tokens).")
+                break
+            context, tokens = reduced, reduced_tokens
+            if shed:
+                logger.warning(f"Map-reduce level {level}: {shed} of {len(chunks)} calls were shed. Stopping here.")
+                break
+        if tokens > self.chunk_tokens:
+            context = context[:(self.chunk_tokens - 1) * 4]
+        return context
+
     def generate_summary(self, context: str, query: str, age_group: str) -> str:
-        if not self.client:
+        if not self.gateway.available:
             return "Sorry, the summarization service is currently unavailable."
         if not context or not context.strip():
             return "There is not enough content to summarize."
-            
-        # Truncate long contexts to stay within the API's free tier limits
-        max_chars = 12000
-        if len(context) > max_chars:
-            logger.warning(f"Context is too long ({len(context)} chars). Truncating to {max_chars} chars.")
-            context = context[:max_chars]
 
         system_instruction = self._get_system_prompt(age_group, query)
         
         try:
-            # The 'system' message gives the AI its instructions.
-            # The 'user' message provides the text to work on.
-            chat_completion = self.client.chat.completions.create(
-                messages=[
-                    {
-                        "role": "system",
-                        "content": system_instruction,
-                    },
-                    {
-                        "role": "user",
-                        "content": context,
-                    }
-                ],
-                model=self.model_name,
-            )
-            summary = chat_completion.choices[0].message.content
-            return summary.strip()
+            # Long contexts are condensed chunk by chunk, as far as the model's token budget allows
+            context = self._reduce_to_budget(context, query)
+            with stage("llm_final"):
+                summary = self._complete(system_instruction, context)
+            return summary
 
+        except LLMUnavailableError as e:
+            logger.error(f"Summarizer unavailable: {e}")
+            return "Sorry, the summarization service is temporarily overloaded. Please try again shortly."
         except Exception as e:
             logger.error(f"Groq API error: {e}")
             return f"Sorry, the summary could not be generated. API Error: {e}"
\ No newline at end of file
@@ -1,6 +1,7 @@
 from deep_translator import GoogleTranslator
 from deep_translator.exceptions import LanguageNotSupportedException
 import logging
+from core.metrics import stage
 
 logger = logging.getLogger(__name__)
 
@@ -14,7 +15,8 @@ class CachingTranslator:
         """Translates text to a given language name or code (e.g., 'spanish', 'es')."""
         try:
             # The library can handle both full names and codes
-            translated_text = GoogleTranslator(source='auto', target=target_lang).translate(text)
+            with stage("translate"):
+                translated_text = GoogleTranslator(source='auto', target=target_lang).translate(text)
             return translated_text
         except LanguageNotSupportedException:
             return f"Language '{target_lang}' is not supported by the translation service."
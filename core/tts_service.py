@@ -1,6 +1,7 @@
 from gtts import gTTS
 from pathlib import Path
 import logging
+from core.metrics import stage
 
 logger = logging.getLogger(__name__)
 
@@ -16,8 +17,9 @@ class TextToSpeechService:
             safe_filename = "".join(c for c in query if c.isalnum() or c in " _-").rstrip()[:50]
             output_path = self.output_dir / f"{safe_filename}.mp3"
             
-            tts = gTTS(text=text, lang=lang, slow=False)
-            tts.save(str(output_path))
+            with stage("tts"):
+                tts = gTTS(text=text, lang=lang, slow=False)
+                tts.save(str(output_path))
             
             logger.info(f"Audio saved successfully to: {output_path}")
             return output_path
@@ -1,5 +1,6 @@
 from pathlib import Path
 import re
+import hashlib
 
 def save_text_to_file(text: str, query: str, subfolder: str = "text_summaries") -> Path:
     """
@@ -17,11 +18,16 @@ def save_text_to_file(text: str, query: str, subfolder: str = "text_summaries")
     output_dir = Path("data") / subfolder
     output_dir.mkdir(exist_ok=True, parents=True)
     
-    # Create a safe filename from the query
-    safe_filename = re.sub(r'[^\w\-_\. ]', '_', query)[:50] + ".txt"
+    # Create a safe filename from the query; the content hash keeps different summaries for similar names apart
+    digest = hashlib.sha256(text.encode('utf-8')).hexdigest()[:8]
+    safe_filename = re.sub(r'[^\w\-_\. ]', '_', query)[:50] + f"_{digest}.txt"
     filepath = output_dir / safe_filename
     
     # Write the summary to the file
     filepath.write_text(text, encoding='utf-8')
     
-    return filepath
\ No newline at end of file
+    return filepath
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count; Llama tokenizers average about four characters per token for English."""
+    return len(text) // 4 + 1
\ No newline at end of file
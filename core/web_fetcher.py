@@ -1,11 +1,16 @@
 import os
+import re
+import time
+import codecs
 import aiohttp
 import asyncio
 import logging
-from bs4 import BeautifulSoup
+from collections import Counter
+from html.parser import HTMLParser
 from ddgs import DDGS
 from typing import List, Dict, Optional
 from googleapiclient.discovery import build
+from core.metrics import metrics, stage, record_stage
 
 logger = logging.getLogger(__name__)
 
@@ -17,7 +22,83 @@ IGNORED_EXTENSIONS = [
     '.pdf', '.xlsx', '.docx', '.zip', '.rar', '.exe', '.mp3', '.mp4', '.jpg', '.png'
 ]
 
+HTML_CONTENT_TYPES = {'text/html', 'application/xhtml+xml', 'text/plain'}
+SKIPPED_TAGS = {'script', 'style', 'nav', 'header', 'footer', 'aside'}
+
+# Browsers look for a <meta> charset declaration in the first 1024 bytes
+CHARSET_SNIFF_BYTES = 1024
+META_CHARSET = re.compile(rb'<meta[^>]+charset\s*=\s*["\']?\s*([\w\-:.]+)', re.IGNORECASE)
+BOMS = [(codecs.BOM_UTF8, 'utf-8-sig'), (codecs.BOM_UTF16_LE, 'utf-16'), (codecs.BOM_UTF16_BE, 'utf-16')]
+
+def sniff_charset(head: bytes, header_charset: Optional[str] = None) -> str:
+    """Picks the page encoding from a BOM, the Content-Type charset or a <meta> tag, defaulting to UTF-8."""
+    for bom, encoding in BOMS:
+        if head.startswith(bom): return encoding
+    match = META_CHARSET.search(head[:CHARSET_SNIFF_BYTES])
+    for candidate in (header_charset, match.group(1).decode('ascii', 'ignore') if match else None):
+        if not candidate: continue
+        try:
+            return codecs.lookup(candidate).name
+        except LookupError:
+            logger.debug(f"Ignoring unknown charset '{candidate}'")
+    return 'utf-8'
+
+class TextExtractor(HTMLParser):
+    """
+    Incrementally collects the visible text of an HTML page, skipping script, style and page
+    chrome (nav, header, footer, aside). Feed it chunks as they arrive; `done` turns True once
+    `max_chars` of text have been gathered, so the caller can stop downloading.
+    """
+    def __init__(self, max_chars: int = 4000):
+        super().__init__(convert_charrefs=True)
+        self.max_chars = max_chars
+        self.words: List[str] = []
+        self.chars = 0
+        self.done = False
+        self._open_skipped = Counter()
+        self._pending: List[str] = []
+
+    def _flush(self):
+        # Text nodes can arrive split across feeds, so words are only cut at tag boundaries
+        if not self._pending: return
+        text, self._pending = ''.join(self._pending), []
+        for word in text.split():
+            self.words.append(word)
+            self.chars += len(word) + 1
+        if self.chars > self.max_chars:
+            self.done = True
+
+    def handle_starttag(self, tag, attrs):
+        self._flush()
+        if tag in SKIPPED_TAGS: self._open_skipped[tag] += 1
+
+    def handle_endtag(self, tag):
+        self._flush()
+        if self._open_skipped[tag] > 0: self._open_skipped[tag] -= 1
+
+    def handle_data(self, data):
+        if not self.done and not any(self._open_skipped.values()):
+            self._pending.append(data)
+
+    def close(self):
+        super().close()
+        self._flush()
+
+    @property
+    def text(self) -> str:
+        return ' '.join(self.words)[:self.max_chars]
+
 class WebFetcher:
+    """
+    Finds links for a query and extracts the main text of the first usable page. Pages are
+    streamed: non-HTML responses are dropped from their headers, at most `max_bytes` are read,
+    and the download stops as soon as `max_chars` of text have been extracted.
+    """
+    def __init__(self, max_bytes: Optional[int] = None, max_chars: int = 4000, chunk_size: int = 16384):
+        self.max_bytes = max_bytes or int(os.getenv("WEB_FETCH_MAX_BYTES", str(2 * 1024 * 1024)))
+        self.max_chars = max_chars
+        self.chunk_size = chunk_size
+
     async def search_google_api(self, query: str, max_results: int = 3) -> List[Dict]:
         api_key = os.getenv("GOOGLE_API_KEY")
         search_engine_id = os.getenv("SEARCH_ENGINE_ID")
@@ -31,7 +112,8 @@ class WebFetcher:
                 return [{'href': item['link'], 'title': item['title']} for item in res.get('items', [])]
             except Exception as e:
                 logger.error(f"Google API search failed: {e}"); return []
-        results = await asyncio.to_thread(_sync_search)
+        with stage("provider_search", provider="google"):
+            results = await asyncio.to_thread(_sync_search)
         logger.info(f"Found {len(results)} links via Google API for query: '{query}'")
         return results
 
@@ -40,46 +122,94 @@ class WebFetcher:
             def _sync_search():
                 with DDGS(timeout=10) as ddgs:
                     return [{'href': r['href'], 'title': r['title']} for r in ddgs.text(query, max_results=max_results)]
-            results = await asyncio.to_thread(_sync_search)
+            with stage("provider_search", provider="ddg"):
+                results = await asyncio.to_thread(_sync_search)
             logger.info(f"Found {len(results)} links via DDG for query: '{query}'")
             return results
         except Exception as e:
             logger.error(f"DDG search error: {e}"); return []
 
-    async def _fetch_html(self, session: aiohttp.ClientSession, url: str) -> Optional[str]:
+    async def _fetch_text(self, session: aiohttp.ClientSession, url: str) -> Optional[str]:
+        """Streams `url` through a TextExtractor and returns the extracted text, or None if the page is unusable."""
         try:
             async with session.get(url, timeout=aiohttp.ClientTimeout(total=10), headers=HEADERS, ssl=False) as response:
-                if response.status == 200:
-                    raw_content = await response.read()
-                    return raw_content.decode('utf-8', errors='ignore')
-                else:
+                if response.status != 200:
+                    metrics.inc("web_fetch_pages_total", outcome="http_error")
+                    return None
+                content_type = response.headers.get('Content-Type', '').split(';')[0].strip().lower()
+                if content_type and content_type not in HTML_CONTENT_TYPES:
+                    logger.warning(f"Skipping {url}: Content-Type is '{content_type}'")
+                    metrics.inc("web_fetch_pages_total", outcome="not_html")
                     return None
+                if response.content_length and response.content_length > self.max_bytes:
+                    logger.info(f"{url} is {response.content_length} bytes. Reading only the first {self.max_bytes}.")
+
+                extractor = TextExtractor(self.max_chars)
+                decoder, head, received, parse_seconds = None, b'', 0, 0.0
+                outcome = "complete"
+                async for chunk in response.content.iter_chunked(self.chunk_size):
+                    chunk = chunk[:self.max_bytes - received]
+                    received += len(chunk)
+                    if decoder is None:
+                        # Hold back the first bytes until there is enough to find a <meta> charset
+                        head += chunk
+                        if len(head) < CHARSET_SNIFF_BYTES and received < self.max_bytes: continue
+                        decoder = codecs.getincrementaldecoder(sniff_charset(head, response.charset))(errors='replace')
+                        chunk = head
+                    parse_start = time.perf_counter()
+                    extractor.feed(decoder.decode(chunk))
+                    parse_seconds += time.perf_counter() - parse_start
+                    if extractor.done:
+                        outcome = "enough_text"; break
+                    if received >= self.max_bytes:
+                        outcome = "byte_cap"; break
+
+                parse_start = time.perf_counter()
+                if decoder is None:
+                    decoder = codecs.getincrementaldecoder(sniff_charset(head, response.charset))(errors='replace')
+                    extractor.feed(decoder.decode(head))
+                extractor.feed(decoder.decode(b'', final=True))
+                extractor.close()
+                record_stage("html_parse", parse_seconds + time.perf_counter() - parse_start)
+                metrics.inc("web_fetch_pages_total", outcome=outcome)
+                metrics.inc("web_fetch_bytes_total", received)
+                return extractor.text
         except Exception as e:
             logger.error(f"Error fetching {url}: {e}"); return None
 
-    def _parse_content(self, html: str) -> str:
-        if not html: return ""
-        soup = BeautifulSoup(html, 'html.parser')
-        for el in soup(["script", "style", "nav", "header", "footer", "aside"]): el.decompose()
-        return ' '.join(soup.get_text(separator=' ', strip=True).split())[:4000]
-
-    async def fetch_and_parse_best_result(self, query: str) -> Optional[Dict]:
+    async def find_links(self, query: str) -> List[Dict]:
+        """Searches with the Google API first and falls back to DDG."""
         links = await self.search_google_api(query)
         if not links:
             logger.warning("Google API failed or returned no results. Falling back to DDG.")
             links = await self.search_ddg(query)
+        return links
+
+    async def fetch_and_parse_best_result(self, query: str, links: Optional[List[Dict]] = None,
+                                          session: Optional[aiohttp.ClientSession] = None) -> Optional[Dict]:
+        """
+        Fetches the first usable page. Pass `links` to reuse a search that was already run,
+        and `session` to share one connection pool across many queries.
+        """
+        if links is None:
+            links = await self.find_links(query)
         if not links:
             logger.warning(f"No web links found for '{query}'."); return None
-        async with aiohttp.ClientSession() as session:
-            for link in links:
-                url = link['href']
-                if any(url.lower().endswith(ext) for ext in IGNORED_EXTENSIONS):
-                    logger.warning(f"Skipping non-HTML link: {url}")
-                    continue
-                html = await self._fetch_html(session, url)
-                if html:
-                    content = self._parse_content(html)
-                    if len(content) > 200:
-                        logger.info(f"Successfully extracted content from {url}")
-                        return {"text": content, "metadata": {"source": url, "title": link.get('title', query)}}
+        if session is None:
+            async with aiohttp.ClientSession() as own_session:
+                return await self._fetch_first_usable(query, links, own_session)
+        return await self._fetch_first_usable(query, links, session)
+
+    async def _fetch_first_usable(self, query: str, links: List[Dict], session: aiohttp.ClientSession) -> Optional[Dict]:
+        for link in links:
+            url = link['href']
+            if any(url.lower().endswith(ext) for ext in IGNORED_EXTENSIONS):
+                logger.warning(f"Skipping non-HTML link: {url}")
+                continue
+            # Parsing overlaps the download, so page_fetch includes the html_parse time recorded inside it
+            with stage("page_fetch"):
+                content = await self._fetch_text(session, url)
+            if content and len(content) > 200:
+                logger.info(f"Successfully extracted content from {url}")
+                return {"text": content, "metadata": {"source": url, "title": link.get('title', query)}}
         return None
\ No newline at end of file
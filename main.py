@@ -10,34 +10,11 @@ from dotenv import load_dotenv
 load_dotenv()
 
 import uvicorn
-from fastapi import FastAPI
-from fastapi.staticfiles import StaticFiles
-from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
-from api.routes import router
 
-app = FastAPI(title="Multi-Modal AI Assistant")
-
-# Add CORS Middleware to allow the UI to connect
-origins = ["null", "http://localhost", "http://127.0.0.1:8000"]
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=origins,
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-# Mount static folders for downloads
-app.mount("/static", StaticFiles(directory="data"), name="static")
-
-# Include all your API endpoints
-app.include_router(router, prefix="/api")
-
-# Serve the index.html file at the root URL ("/")
-@app.get("/", response_class=FileResponse)
-def read_root():
-    return "index.html"
+# Spawned worker processes (e.g. PDF extraction) re-import this file as __mp_main__. They
+# must not build the app, which would load every model and start background writers.
+if __name__ != "__mp_main__":
+    from api.app import app
 
 if __name__ == "__main__":
     url = "http://127.0.0.1:8000"
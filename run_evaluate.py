@@ -1,4 +1,8 @@
+import csv
+import time
 import asyncio
+import argparse
+from pathlib import Path
 import pandas as pd
 import evaluate
 from dotenv import load_dotenv
@@ -6,12 +10,18 @@ from dotenv import load_dotenv
 # Import the SearchEngine from your project's core logic
 from core.search_engine import SearchEngine
 
+RESULT_COLUMNS = [
+    'row_id', 'query', 'reference_summary', 'generated_summary', 'retrieved_urls', 'ground_truth_urls',
+    'rougeL', 'precision', 'recall', 'f1_score',
+    'retrieval_time', 'search_time', 'scoring_time', 'total_time',
+]
+
 def calculate_retrieval_metrics(retrieved_urls: list, ground_truth_urls: list) -> dict:
     """Calculates precision, recall, and F1 score for the retrieval step."""
     # Ensure lists are not empty and handle strings
     if not retrieved_urls: retrieved_urls = []
     if not ground_truth_urls: ground_truth_urls = []
-    
+
     retrieved_set = set(retrieved_urls)
     ground_truth_set = set(ground_truth_urls)
 
@@ -26,82 +36,156 @@ def calculate_retrieval_metrics(retrieved_urls: list, ground_truth_urls: list) -
     return {"precision": precision, "recall": recall, "f1_score": f1_score}
 
 
-async def run_evaluation():
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Evaluate retrieval and summarization quality on a labelled CSV.")
+    parser.add_argument("--input", default="summaries.csv", help="CSV with query, reference_summary and relevant_urls columns.")
+    parser.add_argument("--output", default=None, help="Results CSV. Doubles as the checkpoint when resuming.")
+    parser.add_argument("--concurrency", type=int, default=4, help="Queries evaluated at the same time.")
+    parser.add_argument("--limit", type=int, default=None, help="Evaluate at most this many rows (after sharding).")
+    parser.add_argument("--shard", default=None, metavar="I/N", help="Only evaluate rows where row_id %% N == I, e.g. 0/4.")
+    parser.add_argument("--fresh", action="store_true", help="Ignore an existing results file instead of resuming from it.")
+    args = parser.parse_args()
+
+    if args.shard:
+        index, count = (int(part) for part in args.shard.split("/"))
+        if not 0 <= index < count:
+            parser.error("--shard must look like I/N with 0 <= I < N.")
+        args.shard = (index, count)
+    if args.output is None:
+        args.output = f"evaluation_results.shard{args.shard[0]}of{args.shard[1]}.csv" if args.shard else "evaluation_results.csv"
+    return args
+
+
+def load_completed_rows(output_path: Path) -> set:
+    """Returns the row ids already written by an earlier, possibly interrupted, run."""
+    if not output_path.exists():
+        return set()
+    existing = pd.read_csv(output_path)
+    if 'row_id' not in existing.columns:
+        # Results from the old single-pass script cannot be resumed
+        print(f"WARNING: '{output_path}' has no row_id column. Starting a fresh run.")
+        output_path.unlink()
+        return set()
+    return set(existing['row_id'].astype(int))
+
+
+async def evaluate_row(engine: SearchEngine, rouge_metric, row_id: int, row: pd.Series) -> dict:
+    """Retrieves, summarizes and scores one dataset row, timing each stage."""
+    query = row['query']
+    reference_summary = row['reference_summary']
+    # Split the URLs string into a list
+    ground_truth_urls = row['relevant_urls'].split(';') if isinstance(row['relevant_urls'], str) else []
+    start = time.perf_counter()
+
+    # Get the list of links the fetcher found; the same list is reused by the search below
+    retrieved_links_dicts = await engine.web_fetcher.find_links(query)
+    retrieved_urls = [d['href'] for d in retrieved_links_dicts]
+    retrieved_at = time.perf_counter()
+
+    # Get the generated summary
+    result_data = await engine.search(query=query, age_group='adult', links=retrieved_links_dicts, suggest_video=False)
+    generated_summary = result_data['summary']
+    searched_at = time.perf_counter()
+
+    # ROUGE is CPU-bound, so it runs off the event loop
+    rouge_scores = await asyncio.to_thread(rouge_metric.compute, predictions=[generated_summary], references=[reference_summary])
+    retrieval_scores = calculate_retrieval_metrics(retrieved_urls, ground_truth_urls)
+    finished_at = time.perf_counter()
+
+    return {
+        'row_id': row_id,
+        'query': query,
+        'reference_summary': reference_summary,
+        'generated_summary': generated_summary,
+        'retrieved_urls': ";".join(retrieved_urls),
+        'ground_truth_urls': ";".join(ground_truth_urls),
+        'rougeL': rouge_scores['rougeL'],
+        'precision': retrieval_scores['precision'],
+        'recall': retrieval_scores['recall'],
+        'f1_score': retrieval_scores['f1_score'],
+        'retrieval_time': round(retrieved_at - start, 3),
+        'search_time': round(searched_at - retrieved_at, 3),
+        'scoring_time': round(finished_at - searched_at, 3),
+        'total_time': round(finished_at - start, 3),
+    }
+
+
+async def run_evaluation(args: argparse.Namespace):
     """
-    Loads a manual dataset, runs each query through the search engine,
-    calculates metrics, and saves the results to a CSV file.
+    Loads a manual dataset, runs its queries through the search engine with bounded
+    concurrency, and appends each scored row to the results CSV as soon as it finishes,
+    so an interrupted run resumes where it stopped.
     """
     print("--- Starting Evaluation ---")
-    
+
     # 1. Initialize your system
     load_dotenv()
     engine = SearchEngine()
     rouge_metric = evaluate.load('rouge')
-    
+
     # 2. Load your manual dataset
     try:
-        dataset_df = pd.read_csv("summaries.csv")
+        dataset_df = pd.read_csv(args.input)
     except FileNotFoundError:
-        print("ERROR: 'my_test_data.csv' not found. Please create it first.")
+        print(f"ERROR: '{args.input}' not found. Please create it first.")
         return
 
-    results_list = []
-
-    print(f"Running evaluation on {len(dataset_df)} examples from your CSV...")
-    for index, row in dataset_df.iterrows():
-        query = row['query']
-        reference_summary = row['reference_summary']
-        # Split the URLs string into a list
-        ground_truth_urls = row['relevant_urls'].split(';') if isinstance(row['relevant_urls'], str) else []
-        
-        print(f"Processing query {index+1}/{len(dataset_df)}: {query[:80]}...")
-        
-        # Get the list of links the fetcher found
-        retrieved_links_dicts = await engine.web_fetcher.search_google_api(query)
-        if not retrieved_links_dicts:
-             retrieved_links_dicts = await engine.web_fetcher.search_ddg(query)
-        retrieved_urls = [d['href'] for d in retrieved_links_dicts]
-        
-        # Get the generated summary
-        result_data = await engine.search(query=query, age_group='adult')
-        generated_summary = result_data['summary']
-
-        # Calculate ROUGE scores
-        rouge_scores = rouge_metric.compute(predictions=[generated_summary], references=[reference_summary])
-        
-        # Calculate retrieval metrics
-        retrieval_scores = calculate_retrieval_metrics(retrieved_urls, ground_truth_urls)
-
-        results_list.append({
-            'query': query,
-            'reference_summary': reference_summary,
-            'generated_summary': generated_summary,
-            'retrieved_urls': ";".join(retrieved_urls),
-            'ground_truth_urls': ";".join(ground_truth_urls),
-            'rougeL': rouge_scores['rougeL'],
-            'precision': retrieval_scores['precision'],
-            'recall': retrieval_scores['recall'],
-            'f1_score': retrieval_scores['f1_score'],
-        })
+    if args.shard:
+        index, count = args.shard
+        dataset_df = dataset_df[dataset_df.index % count == index]
+    if args.limit is not None:
+        dataset_df = dataset_df.head(args.limit)
+
+    output_path = Path(args.output)
+    if args.fresh and output_path.exists():
+        output_path.unlink()
+    completed = load_completed_rows(output_path)
+    pending = [(row_id, row) for row_id, row in dataset_df.iterrows() if row_id not in completed]
+    print(f"Running evaluation on {len(pending)} of {len(dataset_df)} examples "
+          f"({len(completed)} already done) with concurrency {args.concurrency}...")
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+    write_header = not output_path.exists()
+    with open(output_path, "a", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=RESULT_COLUMNS)
+        if write_header:
+            writer.writeheader()
+
+        done = 0
+        async def run_one(row_id: int, row: pd.Series):
+            nonlocal done
+            async with semaphore:
+                try:
+                    result = await evaluate_row(engine, rouge_metric, row_id, row)
+                except Exception as e:
+                    # Leave the row unwritten so the next run retries it
+                    print(f"ERROR on row {row_id}: {type(e).__name__}: {e}")
+                    return
+            writer.writerow(result)
+            f.flush()
+            done += 1
+            print(f"[{done}/{len(pending)}] row {row_id} in {result['total_time']:.1f}s: {result['query'][:80]}")
+
+        await asyncio.gather(*(run_one(row_id, row) for row_id, row in pending))
 
     print("--- Evaluation Complete ---")
-    results_df = pd.DataFrame(results_list)
-    
+    results_df = pd.read_csv(output_path)
+
     # Calculate and print average scores
     avg_rougeL = results_df['rougeL'].mean()
     avg_precision = results_df['precision'].mean()
     avg_recall = results_df['recall'].mean()
     avg_f1 = results_df['f1_score'].mean()
-    
-    print(f"\n--- Average Scores ---")
+
+    print(f"\n--- Average Scores ({len(results_df)} rows) ---")
     print(f"Summarization Quality (ROUGE-L): {avg_rougeL:.4f}")
     print(f"Retrieval Precision:               {avg_precision:.4f}")
     print(f"Retrieval Recall:                  {avg_recall:.4f}")
-    print(f"Retrieval F1-Score:                {avg_f1:.4f}\n")
-    
-    output_path = "evaluation_results.csv"
-    results_df.to_csv(output_path, index=False, encoding='utf-8')
+    print(f"Retrieval F1-Score:                {avg_f1:.4f}")
+    print(f"Mean stage times (s): retrieval {results_df['retrieval_time'].mean():.2f}, "
+          f"search {results_df['search_time'].mean():.2f}, scoring {results_df['scoring_time'].mean():.2f}\n")
+
     print(f"Full results saved to {output_path}")
 
 if __name__ == "__main__":
-    asyncio.run(run_evaluation())
\ No newline at end of file
+    asyncio.run(run_evaluation(parse_args()))
@@ -1,15 +1,16 @@
 from pathlib import Path
+import asyncio
 import yt_dlp
-from groq import Groq
-import os
 import logging
+from core.llm_gateway import get_llm_gateway
+from core.metrics import stage
 
 logger = logging.getLogger(__name__)
 
 class AudioProcessor:
     def __init__(self, summarizer):
         self.summarizer = summarizer
-        self.client = Groq(api_key=os.getenv("GROQ_API_KEY"))
+        self.gateway = get_llm_gateway()
         self.temp_dir = Path("data/temp_audio")
         self.summary_dir = Path("data/video_summaries")
         self.temp_dir.mkdir(exist_ok=True, parents=True)
@@ -48,17 +49,24 @@ class AudioProcessor:
                 'outtmpl': str(self.temp_dir / f"{video_id}.%(ext)s"),
                 'quiet': True,
             }
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(video_id, download=True)
-                audio_path = Path(ydl.prepare_filename(info))
+            def download():
+                with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+                    info = ydl.extract_info(video_id, download=True)
+                    return Path(ydl.prepare_filename(info))
+
+            # The download and the gateway calls block, so they run off the event loop
+            with stage("youtube_audio_download"):
+                audio_path = await asyncio.to_thread(download)
             
-            with open(audio_path, "rb") as file:
-                transcription = self.client.audio.transcriptions.create(
-                    file=(audio_path.name, file.read()), model="whisper-large-v3"
+            with stage("transcription"):
+                audio_bytes = audio_path.read_bytes()
+                transcription = await asyncio.to_thread(
+                    self.gateway.transcribe, file=(audio_path.name, audio_bytes), model="whisper-large-v3"
                 )
             
             if transcription.text:
-                summary = self.summarizer.generate_summary(
+                summary = await asyncio.to_thread(
+                    self.summarizer.generate_summary,
                     context=transcription.text,
                     query=f"the YouTube video titled '{video_title}'",
                     age_group="adult"
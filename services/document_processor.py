@@ -1,12 +1,85 @@
+import os
+import hashlib
+import logging
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+from typing import Iterator, Optional
 import fitz  # PyMuPDF library for reading PDFs
 import docx  # Library for reading .docx files
-from core.summarizer import GeminiSummarizer
+from core.keyword_extractor import KeywordExtractor
+from core.metrics import metrics, stage
+from services.pdf_extraction import OCR_AVAILABLE, extract_pages
+
+logger = logging.getLogger(__name__)
 
 class DocumentProcessor:
-    def __init__(self):
-        # We reuse the main summarizer for the keyword extraction task
-        self.summarizer = GeminiSummarizer()
+    def __init__(self, max_pages: int = 500, max_chars: int = 200_000, pages_per_task: int = 8,
+                 max_workers: Optional[int] = None, cache_dir: str = "data/extracted_text"):
+        # Keywords are extracted locally, so uploads need no extra LLM round-trip
+        self.keyword_extractor = KeywordExtractor()
+        # Extraction stops at whichever limit is hit first. Pass the summarizer's max_input_chars, since
+        # text past what its token budget can map is dropped anyway
+        self.max_pages = max_pages
+        self.max_chars = max_chars
+        self.pages_per_task = pages_per_task
+        self.max_workers = max_workers
+        self._pool = None
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(exist_ok=True, parents=True)
+
+    @property
+    def pool(self) -> ProcessPoolExecutor:
+        # Created on first use. Workers are spawned, not forked, so they do not inherit the
+        # server's threads, locks and loaded models
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._pool
+
+    @staticmethod
+    def _file_sha256(filepath: Path) -> str:
+        digest = hashlib.sha256()
+        with open(filepath, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def iter_pdf_pages(self, filepath: Path) -> Iterator[str]:
+        """Yields page texts in order, extracting batches of pages in parallel worker processes."""
+        with fitz.open(filepath) as doc:
+            page_count = min(doc.page_count, self.max_pages)
+        batches = [list(range(start, min(start + self.pages_per_task, page_count)))
+                   for start in range(0, page_count, self.pages_per_task)]
+        if len(batches) <= 1:
+            for _, text in extract_pages(str(filepath), batches[0] if batches else []):
+                yield text
+            return
+
+        # Keep only a small window of batches in flight so an early stop wastes little work
+        window = (self.max_workers or os.cpu_count() or 1) * 2
+        pending = deque()
+        next_batch = 0
+        try:
+            while pending or next_batch < len(batches):
+                while next_batch < len(batches) and len(pending) < window:
+                    pending.append(self.pool.submit(extract_pages, str(filepath), batches[next_batch]))
+                    next_batch += 1
+                for _, text in pending.popleft().result():
+                    yield text
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def _extract_pdf(self, filepath: Path) -> str:
+        parts, total = [], 0
+        for text in self.iter_pdf_pages(filepath):
+            parts.append(text)
+            total += len(text)
+            if total >= self.max_chars:
+                logger.info(f"Stopped extracting {filepath.name} after {len(parts)} pages; summarizer budget reached.")
+                break
+        return "".join(parts)[:self.max_chars]
 
     def extract_text_from_file(self, filepath: Path) -> str:
         """Extracts all text from a given .txt, .pdf, or .docx file."""
@@ -17,8 +90,18 @@ class DocumentProcessor:
         
         elif suffix == '.pdf':
             try:
-                with fitz.open(filepath) as doc:
-                    return "".join(page.get_text() for page in doc)
+                # Re-uploads of the same file are served from the cache
+                cache_path = self.cache_dir / f"{self._file_sha256(filepath)}_{self.max_pages}_{self.max_chars}.txt"
+                if cache_path.exists():
+                    metrics.record_cache("document_text", hit=True)
+                    return cache_path.read_text(encoding='utf-8')
+                metrics.record_cache("document_text", hit=False)
+                with stage("document_extraction", format="pdf"):
+                    text = self._extract_pdf(filepath)
+                # An empty result without OCR is probably a scan; leave it uncached so it is read again once OCR is installed
+                if text.strip() or OCR_AVAILABLE:
+                    cache_path.write_text(text, encoding='utf-8')
+                return text
             except Exception as e:
                 return f"Error reading PDF file: {e}"
         
@@ -32,20 +115,14 @@ class DocumentProcessor:
         else:
             raise ValueError("Unsupported file type. Please use .txt, .pdf, or .docx.")
 
-    def extract_keywords(self, text: str) -> list[str]:
-        """Uses the configured LLM to extract the most important keywords from text."""
-        if not self.summarizer.client:
-            return ["Keyword extraction service unavailable."]
-        
-        keyword_prompt = "Extract the 5 most important and relevant keywords from the following text. Return only a comma-separated list. For example: keyword one, keyword two, keyword three"
-        
+    def extract_keywords(self, text: str, top_n: int = 5) -> list[str]:
+        """Extracts the most important keyphrases locally with TF-IDF candidates and MMR re-ranking."""
         try:
-            keywords_str = self.summarizer.generate_summary(
-                context=text[:4000], # Limit context size
-                query="keyword extraction",
-                age_group="adult"
-            )
-            return [keyword.strip() for keyword in keywords_str.split(',')]
+            with stage("keyword_extraction"):
+                keywords = self.keyword_extractor.extract(text, top_n=top_n)
+            # The uploaded document becomes part of the corpus for later IDF estimates
+            self.keyword_extractor.partial_fit([text])
+            return keywords
         except Exception as e:
-            print(f"Could not extract keywords: {e}")
-            return ["Keyword extraction failed."]
\ No newline at end of file
+            logger.error(f"Could not extract keywords: {e}")
+            return ["Keyword extraction failed."]
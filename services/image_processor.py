@@ -1,10 +1,11 @@
-import os
 import base64
+import asyncio
 from pathlib import Path
-from groq import Groq
 import logging
 from typing import Union
 from core.summarizer import GeminiSummarizer
+from core.llm_gateway import get_llm_gateway
+from core.metrics import stage
 
 logger = logging.getLogger(__name__)
 
@@ -14,11 +15,11 @@ class ImageProcessor:
         Initialize the Image Processor with Groq's vision model.
         """
         try:
-            api_key = os.getenv("GROQ_API_KEY")
-            if not api_key:
+            # Vision calls share rate limits and retries with every other Groq caller
+            self.gateway = get_llm_gateway()
+            if not self.gateway.available:
                 raise ValueError("GROQ_API_KEY not found in environment variables.")
-            
-            self.groq_client = Groq(api_key=api_key)
+
             # Use Groq's actual vision model - Llama 4 Scout supports vision
             self.vision_model = "meta-llama/llama-4-scout-17b-16e-instruct"
             
@@ -89,12 +90,15 @@ Analyze this image carefully and provide:
                 }
             ]
             
-            response = self.groq_client.chat.completions.create(
-                model=self.vision_model,
-                messages=messages,
-                max_tokens=2000,
-                temperature=0.7
-            )
+            # Gateway calls block on rate limits and the API, so they run off the event loop
+            with stage("vision_llm"):
+                response = await asyncio.to_thread(
+                    self.gateway.chat,
+                    model=self.vision_model,
+                    messages=messages,
+                    max_tokens=2000,
+                    temperature=0.7
+                )
             
             image_analysis = response.choices[0].message.content.strip()
             
@@ -102,11 +106,13 @@ Analyze this image carefully and provide:
                 return "The vision model could not analyze the image."
             
             # Generate age-appropriate summary using the summarizer
-            return self.summarizer.generate_summary(
-                context=image_analysis,
-                query="an analysis of an image",
-                age_group=age_group
-            )
+            with stage("summarize", source="image"):
+                return await asyncio.to_thread(
+                    self.summarizer.generate_summary,
+                    context=image_analysis,
+                    query="an analysis of an image",
+                    age_group=age_group
+                )
             
         except Exception as e:
             logger.error(f"Image processing error: {e}")
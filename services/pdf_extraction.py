@@ -0,0 +1,46 @@
+"""
+Page-level PDF extraction that runs inside worker processes.
+
+Workers are spawned rather than forked, so they start from a fresh interpreter and import
+only this module (plus the launching script, which skips the app under __mp_main__). Keep it
+free of project imports so a worker never loads models or starts background threads.
+"""
+import io
+import logging
+from typing import List, Tuple
+import fitz  # PyMuPDF library for reading PDFs
+
+logger = logging.getLogger(__name__)
+
+try:
+    import pytesseract
+    from PIL import Image
+except ImportError:  # OCR is optional; pages without a text layer are then skipped
+    pytesseract = None
+
+OCR_AVAILABLE = pytesseract is not None
+
+def _ocr_page(page, dpi: int, lang: str) -> str:
+    """Renders a page and runs Tesseract on it. Returns '' if OCR is not available."""
+    if pytesseract is None:
+        return ""
+    try:
+        pixmap = page.get_pixmap(dpi=dpi)
+        image = Image.open(io.BytesIO(pixmap.tobytes("png")))
+        return pytesseract.image_to_string(image, lang=lang)
+    except Exception as e:  # Missing tesseract binary, unsupported language, etc.
+        logger.warning(f"OCR failed on page {page.number + 1}: {e}")
+        return ""
+
+def extract_pages(filepath: str, page_numbers: List[int], ocr: bool = True,
+                  ocr_dpi: int = 200, ocr_lang: str = "eng") -> List[Tuple[int, str]]:
+    """Extracts the given pages, falling back to OCR only for pages with no text layer."""
+    pages = []
+    with fitz.open(filepath) as doc:
+        for number in page_numbers:
+            page = doc[number]
+            text = page.get_text()
+            if not text.strip() and ocr:
+                text = _ocr_page(page, ocr_dpi, ocr_lang)
+            pages.append((number, text))
+    return pages
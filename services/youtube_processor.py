@@ -6,6 +6,7 @@ import whisper
 import torch
 import ffmpeg
 from core.summarizer import GeminiSummarizer
+from core.metrics import stage
 from services.image_processor import ImageProcessor
 from typing import List, Dict
 
@@ -52,7 +53,8 @@ class VideoProcessor:
                         filepath = Path(ydl.prepare_filename(info))
                         metadata = { "title": info.get("title"), "uploader": info.get("uploader"), "duration_string": info.get("duration_string") }
                         return filepath, metadata
-                local_video_path, video_metadata = await loop.run_in_executor(None, download_video_and_get_metadata)
+                with stage("video_download"):
+                    local_video_path, video_metadata = await loop.run_in_executor(None, download_video_and_get_metadata)
             else:
                 local_video_path = Path(video_path_or_url)
                 video_metadata = {"title": local_video_path.name}
@@ -71,25 +73,31 @@ class VideoProcessor:
                     decode_options = {"fp16": False}
                     transcription = self.whisper_model.transcribe(str(output_audio_path), **decode_options)
                     return transcription.get('text', '').strip(), output_audio_path
-                return await loop.run_in_executor(None, extract_and_transcribe)
+                with stage("audio_transcribe"):
+                    return await loop.run_in_executor(None, extract_and_transcribe)
             
             async def get_visual_description():
-                frame_paths_local = self._extract_frames(local_video_path, self.ffmpeg_location, num_frames=5)
+                with stage("frame_extraction"):
+                    frame_paths_local = self._extract_frames(local_video_path, self.ffmpeg_location, num_frames=5)
                 if not frame_paths_local: return "No visual content could be analyzed.", []
                 
                 tasks = [self.image_processor.get_summary_for_image(frame, "adult") for frame in frame_paths_local]
-                frame_descriptions = await asyncio.gather(*tasks)
+                with stage("frame_analysis"):
+                    frame_descriptions = await asyncio.gather(*tasks)
                 
                 combined_desc = "\n".join(f"- {desc}" for desc in frame_descriptions if "Could not process" not in desc)
-                return self.summarizer.generate_summary(combined_desc, "a summary of key visual scenes in a video", "adult"), frame_paths_local
+                visual_summary = await asyncio.to_thread(self.summarizer.generate_summary, combined_desc, "a summary of key visual scenes in a video", "adult")
+                return visual_summary, frame_paths_local
 
             (transcript_text, audio_path), (visual_description, frame_paths) = await asyncio.gather(get_audio_transcript(), get_visual_description())
 
             # --- Step 4: Combine Analyses and Generate Final Summary ---
             combined_context = f"AUDIO TRANSCRIPT:\n{transcript_text or 'None'}\n\nVISUAL DESCRIPTION:\n{visual_description}"
-            final_summary = self.summarizer.generate_summary(
-                context=combined_context, query=f"a comprehensive summary of this video's audio and visuals, titled '{video_metadata.get('title', 'Unknown')}'", age_group=age_group
-            )
+            with stage("summarize", source="video"):
+                final_summary = await asyncio.to_thread(
+                    self.summarizer.generate_summary,
+                    context=combined_context, query=f"a comprehensive summary of this video's audio and visuals, titled '{video_metadata.get('title', 'Unknown')}'", age_group=age_group
+                )
             
             return {
                 "metadata": {k: v for k, v in video_metadata.items() if v},